@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+# Where model listings are cached (one entry per backend and host), and how long one stays fresh.
+CATALOG_FILE = Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "plotforge" / "model_catalog.json"
+CATALOG_TTL = int(os.getenv("PLOTFORGE_CATALOG_TTL", "3600"))
+
+OPENAI_MODELS = ["gpt-4-1106-preview", "gpt-4.1-2025-04-14"]
+
+_backends = {}
+_clients = {}
+_lock = threading.Lock()
+
+class Backend:
+    """A model backend, registered by name. Nothing it depends on is imported until it is used.
+
+    ``matches`` recognises the backend's model names (``None`` makes it the
+    fallback for names no other backend claims). ``make_client(model_name)``
+    builds a client: one per process, or one per model with ``per_model``.
+    ``list_models`` reports the models the backend serves, cached under
+    ``host()`` in the model catalog.
+    """
+
+    def __init__(self, name: str, label: str, make_client, matches=None, per_model: bool = False, list_models=None, host=None):
+        self.name = name
+        self.label = label
+        self.make_client = make_client
+        self.matches = matches
+        self.per_model = per_model
+        self.list_models = list_models
+        self.host = host or (lambda: "local")
+
+def register_backend(backend: Backend):
+    _backends[backend.name] = backend
+
+def get_backend(name: str) -> Backend:
+    return _backends[name]
+
+def backend_for(model_name: str) -> str:
+    fallback = None
+    for backend in _backends.values():
+        if backend.matches is None:
+            fallback = fallback or backend.name
+        elif backend.matches(model_name):
+            return backend.name
+    return fallback
+
+@lru_cache(maxsize=None)
+def load_env():
+    """Read ``.env`` into the environment, once, when a backend first needs its settings."""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+def get_client(model_name: str):
+    """Client for ``model_name``; shared backends keep one per process so HTTP connections are pooled and reused."""
+    backend = _backends[backend_for(model_name)]
+    load_env()
+    if backend.per_model:
+        return backend.make_client(model_name)
+    with _lock:
+        if backend.name not in _clients:
+            _clients[backend.name] = backend.make_client(model_name)
+        return _clients[backend.name]
+
+# ───────────────────────── Model Catalog ───────────────────────────────
+def _read_catalog() -> dict:
+    try:
+        return json.loads(CATALOG_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def _write_catalog(catalog: dict):
+    CATALOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = CATALOG_FILE.with_name(CATALOG_FILE.name + ".tmp")
+    tmp.write_text(json.dumps(catalog, indent=2), encoding="utf-8")
+    os.replace(tmp, CATALOG_FILE)
+
+def model_catalog(refresh: bool = False) -> list:
+    """Models every listing backend reports, cached per backend host for ``CATALOG_TTL`` seconds.
+
+    ``refresh`` lists them again regardless of age. A backend that cannot be
+    reached keeps its last cached listing.
+    """
+    load_env()
+    catalog = _read_catalog()
+    now = time.time()
+    changed = False
+    models = []
+    for backend in _backends.values():
+        if backend.list_models is None:
+            continue
+        key = f"{backend.name}@{backend.host()}"
+        entry = catalog.get(key)
+        if refresh or entry is None or now - entry["fetched"] > CATALOG_TTL:
+            try:
+                entry = catalog[key] = {"fetched": now, "models": list(backend.list_models())}
+                changed = True
+            except Exception as e:
+                print(f"[Warning] Could not list {backend.label} models: {e}")
+        if entry:
+            models += [m for m in entry["models"] if m not in models]
+    if changed:
+        _write_catalog(catalog)
+    return models
+
+# ───────────────────────── Built-in Backends ───────────────────────────
+def _openai_client(model_name: str):
+    import openai
+    # Retries are handled by the scheduler, which also sees Retry-After.
+    return openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+def _ollama_client(model_name: str):
+    import ollama
+    return ollama.Client()
+
+def _ollama_models() -> list:
+    import ollama
+    return [m["model"] for m in ollama.Client().list()["models"]]
+
+def _fake_client(model_name: str):
+    from fake_backend import FakeClient
+    return FakeClient(model_name)
+
+def _hf_client(model_name: str):
+    # torch and transformers are only imported for in-process models.
+    from hf_backend import HFClient
+    return HFClient(model_name)
+
+register_backend(Backend("openai", "OpenAI", _openai_client, matches=lambda m: m.startswith("gpt-"),
+                         list_models=lambda: OPENAI_MODELS, host=lambda: os.getenv("OPENAI_BASE_URL", "api.openai.com")))
+register_backend(Backend("ollama", "Ollama", _ollama_client, list_models=_ollama_models,
+                         host=lambda: os.getenv("OLLAMA_HOST", "127.0.0.1:11434")))
+register_backend(Backend("fake", "Fake", _fake_client, matches=lambda m: m.startswith("fake:"), per_model=True))
+register_backend(Backend("hf", "Transformers", _hf_client, matches=lambda m: m.startswith("hf:"), per_model=True))
@@ -0,0 +1,145 @@
+import io
+import json
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import cli
+
+DEFAULT_MODEL = "fake:50:500:jitter=10:seed=1"
+DEFAULT_SIZES = "2x5"
+
+BENCH_THEME = "Memory is a ration, and someone is stealing it."
+BENCH_PREMISE = "In a city of glass, an archivist discovers the AI that rations memories has been rewriting her past."
+
+IO_EVENTS = {"open", "os.listdir", "os.scandir", "os.remove", "os.rename", "os.mkdir", "sqlite3.connect"}
+
+_io_counts = Counter()
+_counting = False
+_hook_installed = False
+
+def _audit(event, args):
+    if _counting and event in IO_EVENTS:
+        _io_counts[event] += 1
+
+def parse_sizes(spec: str) -> list:
+    """``"2x5,4x10"`` -> ``[(2, 5), (4, 10)]`` as (chapters, pages per chapter)."""
+    sizes = []
+    for part in spec.split(","):
+        chapters, pages = part.lower().split("x")
+        sizes.append((int(chapters), int(pages)))
+    return sizes
+
+def _measure(stages: dict, name: str, fn, *args, verbose: bool = False, **kwargs):
+    import tracemalloc
+    global _counting
+    _io_counts.clear()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    _counting = True
+    try:
+        if verbose:
+            fn(*args, **kwargs)
+        else:
+            with redirect_stdout(io.StringIO()):
+                fn(*args, **kwargs)
+    finally:
+        _counting = False
+    elapsed = time.perf_counter() - start
+
+    stage = stages.setdefault(name, {"calls": 0, "seconds": 0.0, "io": Counter(), "peak_mb": 0.0})
+    stage["calls"] += 1
+    stage["seconds"] += elapsed
+    stage["io"].update(_io_counts)
+    stage["peak_mb"] = max(stage["peak_mb"], tracemalloc.get_traced_memory()[1] / 1e6)
+
+def run_book(chapters: int, pages: int, model: str, storage: str = "files", verbose: bool = False) -> dict:
+    """Drive one full book through every pipeline stage in a throwaway projects directory."""
+    stages = {}
+    name = "bench"
+    original_dir = cli.PROJECTS_DIR
+    with tempfile.TemporaryDirectory(prefix="plotforge-bench-") as tmp:
+        cli.PROJECTS_DIR = Path(tmp)
+        start = time.perf_counter()
+        try:
+            _measure(stages, "create_project", cli.create_project, name, model, BENCH_THEME, BENCH_PREMISE, storage, verbose=verbose)
+            _measure(stages, "generate_outline", cli.generate_outline, name, model, verbose=verbose)
+            _measure(stages, "approve_outline", cli.approve_outline, name, verbose=verbose)
+            for chapter in range(1, chapters + 1):
+                _measure(stages, "write_chapter", cli.write_chapter, name, chapter, total_pages=pages, pages_per_chapter=pages, verbose=verbose)
+                _measure(stages, "approve_chapter", cli.approve_chapter, name, chapter, pages_per_chapter=pages, verbose=verbose)
+                _measure(stages, "summarize_chapter", cli.summarize_chapter, name, chapter, pages_per_chapter=pages, verbose=verbose)
+        finally:
+            cli.PROJECTS_DIR = original_dir
+        total = time.perf_counter() - start
+
+    total_pages = chapters * pages
+    writing = stages["write_chapter"]["seconds"]
+    for stage in stages.values():
+        stage["seconds"] = round(stage["seconds"], 4)
+        stage["peak_mb"] = round(stage["peak_mb"], 2)
+        stage["io"] = dict(stage["io"])
+    return {
+        "chapters": chapters,
+        "pages_per_chapter": pages,
+        "storage": storage,
+        "total_seconds": round(total, 4),
+        "pages_per_minute": round(total_pages / total * 60, 2),
+        "writing_pages_per_minute": round(total_pages / writing * 60, 2) if writing else None,
+        "stages": stages,
+    }
+
+def _git_commit():
+    import subprocess
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=cli.BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_run(run: dict):
+    print(f"[Bench] {run['chapters']}x{run['pages_per_chapter']} pages ({run['storage']}): "
+          f"{run['total_seconds']:.2f}s, {run['pages_per_minute']} pages/min overall, "
+          f"{run['writing_pages_per_minute']} pages/min writing")
+    print(f"{'Stage':<18}  {'Calls':>5}  {'Seconds':>8}  {'Opens':>6}  {'Other I/O':>9}  {'Peak MB':>8}")
+    for name, stage in run["stages"].items():
+        opens = stage["io"].get("open", 0)
+        other = sum(stage["io"].values()) - opens
+        print(f"{name:<18}  {stage['calls']:>5}  {stage['seconds']:>8.3f}  {opens:>6}  {other:>9}  {stage['peak_mb']:>8.2f}")
+
+def run_bench(sizes: str = DEFAULT_SIZES, model: str = DEFAULT_MODEL, storage: str = "files", json_path: str = None,
+              verbose: bool = False) -> dict:
+    # Imported per call so that loading this module (every CLI start) stays cheap.
+    import platform
+    import tracemalloc
+    global _hook_installed
+    if not _hook_installed:
+        sys.addaudithook(_audit)
+        _hook_installed = True
+
+    tracemalloc.start()
+    try:
+        runs = []
+        for chapters, pages in parse_sizes(sizes):
+            run = run_book(chapters, pages, model, storage, verbose)
+            print_run(run)
+            runs.append(run)
+    finally:
+        tracemalloc.stop()
+
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "model": model,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "runs": runs,
+    }
+    if json_path == "-":
+        print(json.dumps(report, indent=2))
+    elif json_path:
+        Path(json_path).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"[Saved] {json_path}")
+    return report
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_MAX_MB = 200
+DEFAULT_MAX_AGE_DAYS = 30
+EVICT_EVERY = 16
+
+class ResponseCache:
+    """Content-addressed, on-disk cache of model responses.
+
+    Entries live at ``<root>/<key[:2]>/<key>.json``. A hit bumps the entry's
+    mtime so eviction can drop the least recently used entries once the cache
+    grows past ``max_bytes``; entries older than ``max_age`` seconds expire.
+    With ``refresh`` set every lookup misses but fresh results are still stored.
+    """
+
+    def __init__(self, root: Path, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024,
+                 max_age: float = DEFAULT_MAX_AGE_DAYS * 86400, refresh: bool = False):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(model_name: str, full_prompt: str, max_tokens: int, options: dict) -> str:
+        payload = json.dumps(
+            {"model": model_name, "prompt": full_prompt, "max_tokens": max_tokens, "options": options},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get_entry(self, key: str):
+        """The stored entry for ``key`` (``text`` plus whatever was passed to ``put``), or ``None``."""
+        path = self._path(key)
+        entry = None
+        if not self.refresh and path.exists():
+            try:
+                if time.time() - path.stat().st_mtime <= self.max_age:
+                    entry = json.loads(path.read_text(encoding="utf-8"))
+                    if "text" not in entry:
+                        raise KeyError("text")
+                    os.utime(path)
+                else:
+                    path.unlink(missing_ok=True)
+            except (OSError, ValueError, KeyError):
+                entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def put(self, key: str, text: str, **info):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps({"text": text, "created": time.time(), **info}, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+        with self._lock:
+            self._puts += 1
+            due = self._puts % EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used until under ``max_bytes``."""
+        now = time.time()
+        entries = []
+        for path in self.root.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            if now - st.st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+            else:
+                entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def close(self):
+        self.evict()
+        if self.hits or self.misses:
+            print(f"[Cache] {self.hits} hits, {self.misses} misses")
+
+def open_cache(project_path: Path, meta: dict, mode: str = None):
+    """Return the project's ``ResponseCache`` or ``None`` when caching is off.
+
+    Caching is opt-in through ``project.json`` (``"cache": {"enabled": true}``)
+    or ``mode="on"``; ``mode="off"`` disables it and ``mode="refresh"``
+    recomputes every response while rewriting the cache.
+    """
+    settings = meta.get("cache", {})
+    if mode == "off" or (mode is None and not settings.get("enabled", False)):
+        return None
+    return ResponseCache(
+        project_path / ".cache" / "llm",
+        max_bytes=int(settings.get("max_mb", DEFAULT_MAX_MB) * 1024 * 1024),
+        max_age=settings.get("max_age_days", DEFAULT_MAX_AGE_DAYS) * 86400,
+        refresh=mode == "refresh",
+    )
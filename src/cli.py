@@ -1,25 +1,63 @@
+import contextvars
 import json
-from json_repair import repair_json
 import re
+import threading
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from models import AIModel
-import ollama
+from cache import open_cache
+from metrics import METRICS_FILE, aggregate, load_records, open_metrics, write_prometheus
+from context import BOOK, CHAPTER, DEFAULT_BUDGET, PAGE, Section, compile_prompt, count_tokens, describe, take_lines
+from exporter import export_text, export_xhtml
+from extractive import numpy_available, summarize as summarize_extractive
+from backends import model_catalog
+from models import HEDGE_MIN_SAMPLES, HEDGE_PERCENTILE, STORY_WRAPPER, SYSTEM_PROMPT, HedgePolicy, Session, backend_for, get_model
+from outline_index import get_chapter_entry, load_outline_index
+from scheduler import configure_schedulers
+from journal import digest, open_journal
+from store import export_files, import_files, open_store
+from story_state import load_story_state
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 PROJECTS_DIR = BASE_DIR / "projects"
 
 SUMMARY_MAX_WORDS = 250
 SUMMARY_MIN_WORDS = 100
+# "extractive" scores sentences locally (needs numpy); "head" keeps the page's opening words.
+SUMMARY_STRATEGIES = ("extractive", "head")
+DEFAULT_SUMMARY_STRATEGY = "extractive"
+
+# Chapters written concurrently by write-book.
+BOOK_WORKERS = 4
+
+# Max concurrent requests per backend when fanning out over several models.
+MAX_IN_FLIGHT = {"openai": 4, "ollama": 1, "fake": 8, "hf": 8}
+
+# Token caps for what the story-state index contributes to each page prompt.
+RECALL_TOKENS = 200
+CHARACTER_TOKENS = 120
+
+# Map-reduce chapter summaries: words per map chunk and summaries merged per reduce call.
+SUMMARY_CHUNK_WORDS = 700
+SUMMARY_REDUCE_FANIN = 8
+
+_summary_lock = threading.Lock()
+
+def backend_gates(max_in_flight: dict = None) -> dict:
+    """Per-backend semaphores capping in-flight requests at ``MAX_IN_FLIGHT`` (or the given overrides)."""
+    limits = {**MAX_IN_FLIGHT, **(max_in_flight or {})}
+    return {backend: threading.BoundedSemaphore(max(1, n)) for backend, n in limits.items()}
 
 # ───────────────────────── Utility Helpers ─────────────────────────────
 def load_metadata(project_path: Path):
     with open(project_path / "project.json", encoding="utf-8") as f:
-        return json.load(f)
+        meta = json.load(f)
+    configure_schedulers(meta.get("rate_limits"))
+    return meta
 
-def load_prev_summary(summaries_path: Path, page_number: int) -> str:
-    file = summaries_path / f"page_{page_number - 1}_summary.txt"
-    return file.read_text(encoding="utf-8") if file.exists() else ""
+def load_prev_summary(store, page_number: int) -> str:
+    return store.read_summary(page_number - 1)
 
 def strip_heading(text: str) -> str:
     return re.sub(r"^Page\s+\d+\s+Draft[:\s-]*", "", text, flags=re.IGNORECASE).lstrip()
@@ -27,12 +65,82 @@ def strip_heading(text: str) -> str:
 def sanitize_text(text: str) -> str:
     return text.replace("\u2014", "-").replace("—", "-")
 
-def save_summary(full_text: str, summaries_path: Path, page_number: int):
+def save_summary(full_text: str, store, page_number: int, strategy: str = DEFAULT_SUMMARY_STRATEGY, previous_summary: str = None):
+    """Write the page summary; ``previous_summary`` defaults to the stored summary of the page before."""
     cleaned = strip_heading(full_text)
     words = cleaned.split()
     take = min(SUMMARY_MAX_WORDS, max(SUMMARY_MIN_WORDS, len(words) // 2))
-    summary = " ".join(words[:take])
-    (summaries_path / f"page_{page_number}_summary.txt").write_text(summary, encoding="utf-8")
+    if strategy == "extractive":
+        if previous_summary is None:
+            previous_summary = store.read_summary(page_number - 1)
+        summary = summarize_extractive(cleaned, take, previous_summary)
+    else:
+        summary = " ".join(words[:take])
+    store.write_summary(page_number, summary)
+
+def summary_strategy(meta: dict, override: str = None) -> str:
+    strategy = override or meta.get("summary_strategy", DEFAULT_SUMMARY_STRATEGY)
+    if strategy == "extractive" and not numpy_available():
+        print("[Warning] numpy is not installed; using head summaries")
+        return "head"
+    return strategy
+
+def open_hedge(project_path: Path, meta: dict, model_name: str, mode: str = None):
+    """The project's ``HedgePolicy`` for ``model_name``, or ``None`` when hedging is off.
+
+    ``mode`` ("on"/"off") overrides ``"hedge": {"enabled": ...}`` in project.json. The secondary is
+    ``"hedge": {"secondary": ...}`` or else the first other available model, preferring another backend.
+    """
+    settings = meta.get("hedge", {})
+    if mode == "off" or (mode is None and not settings.get("enabled")):
+        return None
+    others = [m for m in meta["models"]["available"] if m != model_name]
+    secondary = settings.get("secondary") or next((m for m in others if backend_for(m) != backend_for(model_name)), others[0] if others else None)
+    if secondary not in others:
+        print(f"[Warning] Hedging off: {secondary or 'no secondary model'} is not another available model in project.json")
+        return None
+    history = (e for e in load_records(project_path / METRICS_FILE) if e.get("model") == model_name)
+    return HedgePolicy(secondary, settings.get("percentile", HEDGE_PERCENTILE), settings.get("min_samples", HEDGE_MIN_SAMPLES), history)
+
+class PartialDraft:
+    """Appends streamed tokens to ``<draft>.partial`` as they arrive.
+
+    Text is sanitized per fragment; the start of the stream is held back until
+    a ``Page N Draft`` heading can be recognised and stripped. The file is
+    flushed on every write so an interrupted run leaves usable output behind.
+    """
+    HEADING_WINDOW = 40
+
+    def __init__(self, draft_path: Path):
+        self.path = draft_path.with_name(draft_path.name + ".partial")
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._head = ""
+        self._started = False
+
+    def write(self, token: str):
+        token = sanitize_text(token)
+        if not self._started:
+            self._head += token
+            if len(self._head.lstrip()) < self.HEADING_WINDOW:
+                return
+            token = self._release_head()
+        self._file.write(token)
+        self._file.flush()
+
+    def _release_head(self) -> str:
+        self._started = True
+        head, self._head = self._head.lstrip(), ""
+        return strip_heading(head)
+
+    def close(self, keep: bool = False):
+        if not self._started:
+            self._file.write(self._release_head())
+        self._file.close()
+        if not keep:
+            self.path.unlink(missing_ok=True)
+
+def echo_token(token: str):
+    print(token, end="", flush=True)
 
 def get_chapter_dir(project_path: Path, chapter_number: int) -> Path:
     chapter_dir = project_path / "chapters" / f"chapter_{chapter_number}"
@@ -40,42 +148,27 @@ def get_chapter_dir(project_path: Path, chapter_number: int) -> Path:
     return chapter_dir
 
 def get_chapter_summary(project_path: Path, chapter_number: int) -> str:
-    raw_path = project_path / "chapters" / "outline_raw.txt"
-    json_path = project_path / "chapters" / "outline.json"
-
-    if raw_path.exists():
-        text = raw_path.read_text(encoding="utf-8")
-        pattern = rf"(?i)^chapter\s*{chapter_number}.*?(?:\n\n|\Z)(.*?)(?=\n\s*(?:Chapter\s*\d+|$))"
-        match = re.search(pattern, text, re.DOTALL | re.IGNORECASE)
-        if match:
-            return match.group(1).strip()
-
-    if json_path.exists():
-        try:
-            data = json.loads(json_path.read_text(encoding="utf-8"))
-            return data.get("chapters", [])[chapter_number - 1].get("summary", "")
-        except Exception:
-            pass
-
-    return ""
-
-def create_project(name: str):
+    return get_chapter_entry(project_path, chapter_number).get("summary", "")
+
+def create_project(name: str, primary_model: str = None, theme: str = None, premise: str = None, storage: str = "files"):
+    """Create a project; with ``primary_model`` given it runs non-interactively without model discovery."""
     project_path = PROJECTS_DIR / name
     project_path.mkdir(parents=True, exist_ok=True)
 
-    theme = (BASE_DIR / "theme.txt").read_text(encoding="utf-8").strip()
-    premise = (BASE_DIR / "premise.txt").read_text(encoding="utf-8").strip()
+    theme = theme if theme is not None else (BASE_DIR / "theme.txt").read_text(encoding="utf-8").strip()
+    premise = premise if premise is not None else (BASE_DIR / "premise.txt").read_text(encoding="utf-8").strip()
 
-    ollama_models = [m["model"] for m in ollama.list()["models"]]
-    openai_models = ["gpt-4-1106-preview", "gpt-4.1-2025-04-14"]
-    available_models = openai_models + ollama_models
+    if primary_model:
+        available_models = [primary_model]
+    else:
+        available_models = model_catalog()
 
-    print("[Available Models]")
-    for idx, model in enumerate(available_models):
-        print(f"{idx + 1}: {model}")
-    choice = input("Select a primary model by number (default 1): ").strip()
-    selected_index = int(choice) - 1 if choice.isdigit() else 0
-    primary_model = available_models[selected_index]
+        print("[Available Models]")
+        for idx, model in enumerate(available_models):
+            print(f"{idx + 1}: {model}")
+        choice = input("Select a primary model by number (default 1): ").strip()
+        selected_index = int(choice) - 1 if choice.isdigit() else 0
+        primary_model = available_models[selected_index]
 
     metadata = {
         "title": name,
@@ -86,7 +179,12 @@ def create_project(name: str):
             "available": available_models
         },
         "chapters": [],
-        "outline_approved": False
+        "outline_approved": False,
+        "cache": {"enabled": False, "max_mb": 200, "max_age_days": 30},
+        "storage": storage,
+        "context_budget": DEFAULT_BUDGET,
+        "summary_strategy": DEFAULT_SUMMARY_STRATEGY,
+        "hedge": {"enabled": False, "secondary": None, "percentile": HEDGE_PERCENTILE, "min_samples": HEDGE_MIN_SAMPLES}
     }
 
     with open(project_path / "project.json", "w", encoding="utf-8") as f:
@@ -98,26 +196,104 @@ def create_project(name: str):
     print(f"[Project Created] {name}")
 
 # ───────────────────────── Prompt Composition ──────────────────────────
-def build_prompt(prev_summary: str, premise: str, page_number: int, project_path: Path = None, chapter_summary: str = "") -> str:
-    prompt = (
-        f"## DO NOT output any heading. Begin directly with story text.\n\n"
-        f"PREMISE:\n{premise}\n\n"
+PAGE_HEADER = "## DO NOT output any heading. Begin directly with story text.\n\n"
+PAGE_TASK = "Continue the story in the next ~500 words, preserving tone, characters, and continuity.\n\n"
+
+def flatten(value) -> str:
+    """One line of outline text, whether the outline JSON gave a string, a list or a dict."""
+    if isinstance(value, dict):
+        return "; ".join(f"{k}: {flatten(v)}" for k, v in value.items() if v)
+    if isinstance(value, list):
+        return ", ".join(flatten(v) for v in value if v)
+    return " ".join(str(value or "").split())
+
+def outline_sections(project_path: Path, chapter_number: int) -> list:
+    """Outline material for the stable part of a page prompt.
+
+    Characters, setting, theme and the book's chapter plan are the same on
+    every page of the book, and the current chapter's plan on every page of
+    the chapter, so together with the premise they make a prefix long enough
+    for OpenAI's prompt cache (1024 tokens) instead of a few hundred tokens.
+    """
+    index = load_outline_index(project_path)
+    cast = "\n".join(
+        f"- {c.get('name')}" + (f" ({flatten(c.get('role'))})" if c.get("role") else "") + (f": {flatten(c.get('traits'))}" if c.get("traits") else "")
+        for c in index.get("characters", []) if c.get("name")
     )
-    if page_number > 1:
-        prompt += f"PREVIOUS PAGE SUMMARY:\n{prev_summary}\n\n"
+    setting = "\n".join(f"{label}: {flatten(index.get(key))}" for key, label in (("setting", "Setting"), ("theme", "Theme")) if index.get(key))
+    plan = [f"{n}. {flatten(entry.get('title'))}: {flatten(entry.get('summary'))}" for n, entry in sorted(index["chapters"].items(), key=lambda kv: int(kv[0]))]
+    if index.get("key_scenes"):
+        plan.append(f"Key scenes: {flatten(index['key_scenes'])}")
+    entry = index["chapters"].get(str(chapter_number), {})
+    chapter = [f"Title: {flatten(entry.get('title'))}"] if entry.get("title") else []
+    chapter += [f"{part.capitalize()}: {flatten(text)}" for part, text in entry.get("structure", {}).items() if text]
+    if entry.get("key_scenes"):
+        chapter.append(f"Key scenes: {flatten(entry['key_scenes'])}")
+    if entry.get("characters"):
+        chapter.append(f"Characters: {', '.join(entry['characters'])}")
+    sections = [
+        Section("setting", setting, 3, "SETTING AND THEME", stability=BOOK),
+        Section("cast", cast, 3, "CHARACTERS", stability=BOOK),
+        Section("outline", "\n".join(plan), 4, "BOOK OUTLINE", stability=BOOK),
+        Section("plan", "\n".join(chapter), 2, "CHAPTER PLAN", stability=CHAPTER),
+    ]
+    return [s for s in sections if s.text]
+
+def build_prompt(prev_summary: str, premise: str, page_number: int, project_path: Path = None, chapter_summary: str = "",
+                 model_name: str = "", budget: int = DEFAULT_BUDGET, first_page: int = 1, recall_pages=(), chapter_number: int = None) -> str:
+    """Assemble the page prompt within ``budget`` tokens for ``model_name``.
+
+    The prompt runs from most to least stable: header, premise, the book's
+    outline material, chapter summary and plan, and task are identical on
+    every page of a chapter (see ``outline_sections``), and only the
+    page-level sections after them change, so the backend can serve the
+    shared prefix from its prompt cache. With ``project_path`` the story-state
+    index adds the most relevant earlier pages and the latest state of the
+    characters involved, each under a fixed token cap. Only pages from
+    ``first_page`` on inform the prompt, plus the earlier ``recall_pages``, so
+    with ``first_page`` set to the chapter's first page the prompt depends only
+    on its own chapter and on pages that were already final. Sections that do
+    not fit are compressed or truncated.
+    """
+    sections = [Section("premise", premise, 3, "PREMISE", stability=BOOK)]
     if chapter_summary:
-        prompt += f"CURRENT CHAPTER SUMMARY:\n{chapter_summary}\n\n"
-    prompt += "Continue the story in the next ~500 words, preserving tone, characters, and continuity.\n"
-    return prompt
+        sections.append(Section("chapter", chapter_summary, 2, "CURRENT CHAPTER SUMMARY", stability=CHAPTER))
+    if project_path is not None and chapter_number is not None:
+        # Rendered by stability, so the book-level ones still come right after the premise.
+        sections += outline_sections(project_path, chapter_number)
+    if project_path is not None and (page_number > first_page + 1 or recall_pages):
+        state = load_story_state(project_path)
+        query = f"{prev_summary}\n{chapter_summary}"
+        passages = state.passages(query, page_number - 1, since_page=first_page, extra_pages=recall_pages)
+        characters = state.character_states(f"{query}\n{passages}", page_number, since_page=first_page, extra_pages=recall_pages)
+        if characters:
+            sections.append(Section("characters", take_lines(characters, CHARACTER_TOKENS, model_name), 2, "CHARACTER STATES", stability=PAGE))
+        if passages:
+            sections.append(Section("recall", take_lines(passages, RECALL_TOKENS, model_name), 3, "EARLIER IN THE STORY", stability=PAGE))
+    if page_number > first_page:
+        sections.append(Section("previous", prev_summary, 1, "PREVIOUS PAGE SUMMARY", stability=PAGE))
+
+    fixed = (SYSTEM_PROMPT, STORY_WRAPPER, PAGE_HEADER, PAGE_TASK)
+    stable, volatile = compile_prompt(sections, budget, model_name, fixed)
+    fixed_tokens = sum(count_tokens(text, model_name) for text in fixed)
+    print(f"[Context] Page {page_number}: {describe(sections, budget, fixed_tokens)}")
+    return PAGE_HEADER + "".join(s.render() for s in stable) + PAGE_TASK + "".join(s.render() for s in volatile)
 
 # ───────────────────────── Model Management ────────────────────────────
-def manage_models(project: str, list_flag=False, set_primary=None):
+def manage_models(project: str, list_flag=False, set_primary=None, refresh=False):
     path = PROJECTS_DIR / project / "project.json"
     if not path.exists():
         print(f"[Error] Project '{project}' not found.")
         return
     meta = json.loads(path.read_text(encoding="utf-8"))
 
+    if refresh:
+        available = meta["models"]["available"]
+        found = [m for m in model_catalog(refresh=True) if m not in available]
+        available.extend(found)
+        path.write_text(json.dumps(meta, indent=4))
+        print(f"[Models Refreshed] {len(found)} new model(s)" + (f": {', '.join(found)}" if found else ""))
+
     if list_flag:
         print("[Models]")
         for m in meta["models"]["available"]:
@@ -133,27 +309,94 @@ def manage_models(project: str, list_flag=False, set_primary=None):
         print(f"[Model Updated] Primary set to {set_primary}")
 
 # ───────────────────────── Chapter/Pages Generation ────────────────────
-def generate_and_save_page(model_name: str, prompt: str, chapter_dir: Path, summaries_path: Path, page_number: int, test_mode: bool):
-    model = AIModel(model_name)
+def generate_and_save_page(model_name: str, prompt: str, store, chapter_number: int, page_number: int, test_mode: bool, stream: bool = False, cache=None, metrics=None,
+                           session=None, strategy: str = DEFAULT_SUMMARY_STRATEGY, previous_summary: str = None, hedge=None):
+    """Generate, save and summarize one page; returns ``(words, seconds, model)`` (the model that won if ``hedge`` fired) or ``None``."""
+    model = get_model(model_name)
+    suffix = f"_{model_name.replace('/', '_')}" if test_mode else ""
+    partial = PartialDraft(store.chapter_dir(chapter_number) / f"page_{page_number}_draft{suffix}.md") if stream else None
+    on_token = partial.write if partial else None
+    requested = model_name
     try:
-        text, words, duration = model.generate(prompt, min_words=500)
+        if hedge:
+            text, words, duration, ttft, model_name = hedge.generate(model, prompt, min_words=500, on_token=on_token, cache=cache, metrics=metrics,
+                                                                     session=session)
+        else:
+            text, words, duration, ttft = model.generate(prompt, min_words=500, on_token=on_token, cache=cache, metrics=metrics, session=session)
     except Exception as e:
+        if partial:
+            partial.close(keep=True)
+            print(f"[Partial] Kept {partial.path.name}")
         print(f"[Error] {model_name}: {e}")
-        return
+        return None
 
     text = sanitize_text(text)
     text = strip_heading(text)
-    suffix = f"_{model_name.replace('/', '_')}" if test_mode else ""
-    draft_path = chapter_dir / f"page_{page_number}_draft{suffix}.md"
 
     if text.strip():
-        draft_path.write_text(text.strip(), encoding="utf-8")
-        save_summary(text, summaries_path, page_number)
-        print(f"[Saved] Page {page_number} draft{suffix} ({words} words, {duration:.2f}s)")
+        with store.batch():
+            store.write_draft(chapter_number, page_number, text.strip(), suffix)
+            store.record_run(page_number, model_name, words, duration)
+            # Candidate drafts from --test-models must not overwrite the page's summary or index entry.
+            if not test_mode:
+                with _summary_lock:
+                    save_summary(text, store, page_number, strategy, previous_summary)
+                    load_story_state(store.project_path).add_page(page_number, chapter_number, text, store.read_summary(page_number))
+        if partial:
+            partial.close()
+        first = f", first token {ttft:.2f}s" if ttft is not None else ""
+        by = f", by {model_name}" if model_name != requested else ""
+        print(f"[Saved] Page {page_number} draft{suffix} ({words} words, {duration:.2f}s{first}{by})")
+        return words, duration, model_name
     else:
+        if partial:
+            partial.close()
         print(f"[Skipped] Empty result from {model_name}")
-
-def generate_page(project: str, page_number: int, model_override=None, test_models=False, pages_per_chapter: int = 10):
+        return None
+
+def fan_out_page(models: list, prompt: str, store, chapter_number: int, page_number: int, max_in_flight: dict = None, stream: bool = False, cache=None, metrics=None,
+                 strategy: str = DEFAULT_SUMMARY_STRATEGY):
+    """Generate the same page with several models at once.
+
+    Requests are capped per backend by ``max_in_flight`` (falling back to
+    ``MAX_IN_FLIGHT``); each draft is saved as soon as its model returns and a
+    failing model never cancels the others.
+    """
+    gates = backend_gates(max_in_flight)
+
+    def run(model_name):
+        with gates[backend_for(model_name)]:
+            return generate_and_save_page(model_name, prompt, store, chapter_number, page_number, test_mode=True, stream=stream, cache=cache, metrics=metrics,
+                                          strategy=strategy)
+
+    start = time.time()
+    results = {}
+    # Tasks run in a copy of the caller's context, so output from a daemon job stays with that job.
+    with ThreadPoolExecutor(max_workers=max(1, len(models))) as pool:
+        futures = {pool.submit(contextvars.copy_context().run, run, m): m for m in models}
+        for future in as_completed(futures):
+            model_name = futures[future]
+            try:
+                results[model_name] = future.result()
+            except Exception as e:
+                print(f"[Error] {model_name}: {e}")
+                results[model_name] = None
+    wall = time.time() - start
+
+    width = max([len(m) for m in models] + [5])
+    print(f"[Test Models] Page {page_number}: {len(models)} models in {wall:.2f}s")
+    print(f"{'Model':<{width}}  {'Status':<6}  {'Words':>6}  {'Latency':>8}")
+    for m in models:
+        result = results.get(m)
+        if result:
+            words, duration, _ = result
+            print(f"{m:<{width}}  {'ok':<6}  {words:>6}  {duration:>7.2f}s")
+        else:
+            print(f"{m:<{width}}  {'failed':<6}  {'-':>6}  {'-':>8}")
+    return results
+
+def generate_page(project: str, page_number: int, model_override=None, test_models=False, pages_per_chapter: int = 10, max_in_flight: dict = None, stream: bool = False, cache_mode: str = None, context_budget: int = None,
+                  strategy: str = None, hedge_mode: str = None):
     project_path = PROJECTS_DIR / project
     meta = load_metadata(project_path)
     if not meta.get("outline_approved", False):
@@ -161,79 +404,133 @@ def generate_page(project: str, page_number: int, model_override=None, test_mode
         return
 
     chapter_number = (page_number - 1) // pages_per_chapter + 1
-    chapter_dir = get_chapter_dir(project_path, chapter_number)
-    summaries = project_path / "summaries"
+    store = open_store(project_path, meta)
 
-    prev_summary = load_prev_summary(summaries, page_number)
+    prev_summary = load_prev_summary(store, page_number)
     chapter_summary = get_chapter_summary(project_path, chapter_number)
-    prompt = build_prompt(prev_summary, meta["premise"], page_number, project_path, chapter_summary)
-
-    models = meta["models"]["available"] if test_models else [model_override or meta["models"]["primary"]]
-    for m in models:
-        generate_and_save_page(m, prompt, chapter_dir, summaries, page_number, test_mode=test_models)
-
-def write_chapter(project: str, chapter_number: int, total_pages: int = 10, model_override=None, pages_per_chapter: int = 10):
+    model_name = model_override or meta["models"]["primary"]
+    budget = context_budget or meta.get("context_budget", DEFAULT_BUDGET)
+    prompt = build_prompt(prev_summary, meta["premise"], page_number, project_path, chapter_summary, model_name, budget, chapter_number=chapter_number)
+
+    cache = open_cache(project_path, meta, cache_mode)
+    metrics = open_metrics(project_path, "generate-page")
+    strategy = summary_strategy(meta, strategy)
+    if test_models:
+        fan_out_page(meta["models"]["available"], prompt, store, chapter_number, page_number, max_in_flight, stream=stream, cache=cache, metrics=metrics,
+                     strategy=strategy)
+    else:
+        generate_and_save_page(model_name, prompt, store, chapter_number, page_number, test_mode=False, stream=stream, cache=cache, metrics=metrics,
+                               strategy=strategy, hedge=open_hedge(project_path, meta, model_name, hedge_mode))
+    if cache:
+        cache.close()
+    metrics.close()
+    store.close()
+
+def write_chapter(project: str, chapter_number: int, total_pages: int = 10, model_override=None, pages_per_chapter: int = 10, stream: bool = False, cache_mode: str = None,
+                  context_budget: int = None, strategy: str = None, hedge_mode: str = None):
     project_path = PROJECTS_DIR / project
     meta = load_metadata(project_path)
     if not meta.get("outline_approved", False):
         print("[Blocked] Outline not approved.")
         return
 
-    summaries = project_path / "summaries"
+    store = open_store(project_path, meta)
     model_name = model_override or meta["models"]["primary"]
     chapter_summary = get_chapter_summary(project_path, chapter_number)
-    chapter_dir = get_chapter_dir(project_path, chapter_number)
+    budget = context_budget or meta.get("context_budget", DEFAULT_BUDGET)
+    cache = open_cache(project_path, meta, cache_mode)
+    metrics = open_metrics(project_path, "write-chapter")
+    strategy = summary_strategy(meta, strategy)
+    hedge = open_hedge(project_path, meta, model_name, hedge_mode)
 
+    session = Session()
     print(f"[Writing Chapter {chapter_number}] Using model: {model_name}")
     for i in range(total_pages):
         page_number = (chapter_number - 1) * pages_per_chapter + i + 1
-        prev_summary = load_prev_summary(summaries, page_number)
-        prompt = build_prompt(prev_summary, meta["premise"], page_number, project_path, chapter_summary)
-        generate_and_save_page(model_name, prompt, chapter_dir, summaries, page_number, test_mode=False)
-
+        prev_summary = load_prev_summary(store, page_number)
+        prompt = build_prompt(prev_summary, meta["premise"], page_number, project_path, chapter_summary, model_name, budget,
+                              chapter_number=chapter_number)
+        generate_and_save_page(model_name, prompt, store, chapter_number, page_number, test_mode=False, stream=stream, cache=cache, metrics=metrics,
+                               session=session, strategy=strategy, hedge=hedge)
+
+    if cache:
+        cache.close()
+    metrics.close()
+    store.close()
     print(f"[Complete] Chapter {chapter_number} written ({total_pages} pages)")
 
 # ───────────────────────── Chapter Approval & Summarization ────────────
 def approve_chapter(project: str, chapter_number: int, pages_per_chapter: int = 10):
     project_path = PROJECTS_DIR / project
-    chapter_dir = get_chapter_dir(project_path, chapter_number)
+    store = open_store(project_path, load_metadata(project_path))
 
     page_numbers = range((chapter_number - 1) * pages_per_chapter + 1, chapter_number * pages_per_chapter + 1)
-    for page_num in page_numbers:
-        draft_file = chapter_dir / f"page_{page_num}_draft.md"
-        if draft_file.exists():
-            approval_file = chapter_dir / f"page_{page_num}_approved.txt"
-            approval_file.write_text("auto-approved", encoding="utf-8")
-            print(f"[Auto-Approved] Page {page_num}")
-
-    approved_flag = chapter_dir / f"chapter_{chapter_number}_approved.txt"
-    approved_flag.write_text("approved", encoding="utf-8")
+    for page_num in store.approve_pages(chapter_number, page_numbers):
+        print(f"[Auto-Approved] Page {page_num}")
+
     print(f"[Approved] Chapter {chapter_number} marked as approved.")
+    store.close()
     concat_chapter(project, chapter_number, pages_per_chapter)
 
 def concat_chapter(project: str, chapter_number: int, pages_per_chapter: int = 10):
     project_path = PROJECTS_DIR / project
-    chapter_dir = get_chapter_dir(project_path, chapter_number)
+    store = open_store(project_path, load_metadata(project_path))
 
     page_numbers = range((chapter_number - 1) * pages_per_chapter + 1, chapter_number * pages_per_chapter + 1)
-    output = ""
-
-    for n in page_numbers:
-        page_file = chapter_dir / f"page_{n}_draft.md"
-        if not page_file.exists():
-            print(f"[Missing] Page {n} does not exist. Skipping.")
-            continue
-        approved = chapter_dir / f"page_{n}_approved.txt"
-        if not approved.exists():
-            print(f"[Warning] Page {n} not approved. Skipping.")
+    location, _ = build_chapter_final(store, chapter_number, page_numbers)
+    print(f"[Saved] {location}")
+    store.close()
+
+def build_chapter_final(store, chapter_number: int, page_numbers):
+    """Stream the chapter's approved pages into its final text; returns ``(location, pages_written)``."""
+    written = 0
+
+    def pieces():
+        nonlocal written
+        for n, text, approved in store.chapter_pages(chapter_number, page_numbers):
+            if text is None:
+                print(f"[Missing] Page {n} does not exist. Skipping.")
+                continue
+            if not approved:
+                print(f"[Warning] Page {n} not approved. Skipping.")
+                continue
+            yield ("\n\n" if written else "") + text.strip()
+            written += 1
+
+    location = store.write_chapter_final(chapter_number, pieces())
+    return location, written
+
+def export_book(project: str, fmt: str = "md", output: str = None, pages_per_chapter: int = 10):
+    project_path = PROJECTS_DIR / project
+    meta = load_metadata(project_path)
+    store = open_store(project_path, meta)
+    outline = load_outline_index(project_path)["chapters"]
+    start = time.time()
+
+    chapters, cached = [], 0
+    for number in store.chapter_numbers():
+        page_numbers = range((number - 1) * pages_per_chapter + 1, number * pages_per_chapter + 1)
+        if store.final_is_current(number, page_numbers):
+            cached += 1
+        elif build_chapter_final(store, number, page_numbers)[1] == 0:
+            print(f"[Skipped] Chapter {number} has no approved pages.")
             continue
-        output += page_file.read_text(encoding="utf-8").strip() + "\n\n"
+        chapters.append((number, outline.get(str(number), {}).get("title", "")))
+
+    export_dir = project_path / "export"
+    if fmt == "xhtml":
+        target = Path(output) if output else export_dir / "xhtml"
+        export_xhtml(store, chapters, target, meta["title"])
+    else:
+        target = Path(output) if output else export_dir / f"{project}.{fmt}"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        export_text(store, chapters, target, fmt, meta["title"])
+    store.close()
+
+    print(f"[Exported] {len(chapters)} chapters to {target} ({cached} reused from chapter finals, {time.time() - start:.2f}s)")
 
-    final_path = chapter_dir / f"chapter_{chapter_number}_final.md"
-    final_path.write_text(output.strip(), encoding="utf-8")
-    print(f"[Saved] {final_path}")
 #generate outline
-def generate_outline(project: str, model_override=None):
+def generate_outline(project: str, model_override=None, stream: bool = False, cache_mode: str = None):
     project_path = PROJECTS_DIR / project
     meta_path = project_path / "project.json"
     if not meta_path.exists():
@@ -243,8 +540,17 @@ def generate_outline(project: str, model_override=None):
     meta = load_metadata(project_path)
     theme, premise = meta["theme"], meta["premise"]
     model_name = model_override or meta["models"]["primary"]
-    model = AIModel(model_name)
+    model = get_model(model_name)
+    cache = open_cache(project_path, meta, cache_mode)
+    metrics = open_metrics(project_path, "generate-outline")
+    try:
+        _generate_outline(project_path, model, theme, premise, stream, cache, metrics)
+    finally:
+        if cache:
+            cache.close()
+        metrics.close()
 
+def _generate_outline(project_path: Path, model, theme: str, premise: str, stream: bool, cache, metrics):
     # ── Step 1: Generate human-readable outline ──────────────────────
     prose_prompt = (
         "You are a professional story architect. Given the theme and premise below, write a full novel outline in natural language. "
@@ -259,7 +565,9 @@ def generate_outline(project: str, model_override=None):
     )
 
     try:
-        prose_text, *_ = model.generate(prose_prompt, min_words=700)
+        prose_text, _, duration, ttft = model.generate(prose_prompt, min_words=700, on_token=echo_token if stream else None, cache=cache, metrics=metrics)
+        if stream:
+            print(f"\n[Streamed] Outline prose in {duration:.2f}s (first token {ttft}s)")
         raw_path = project_path / "chapters" / "outline_raw.txt"
         raw_path.write_text(prose_text.strip(), encoding="utf-8")
         print(f"[Saved] {raw_path}")
@@ -288,14 +596,18 @@ def generate_outline(project: str, model_override=None):
     )
 
     try:
-        json_text, *_ = model.generate(json_prompt, min_words=300)
+        json_text, *_ = model.generate(json_prompt, min_words=300, cache=cache, metrics=metrics, max_continuations=0)
 
+        # Imported here so commands that never parse an outline start without it.
+        from json_repair import repair_json
         repaired_text = repair_json(json_text)
         outline = json.loads(repaired_text)
 
         outline_path = project_path / "chapters" / "outline.json"
         outline_path.write_text(json.dumps(outline, indent=4), encoding="utf-8")
         print(f"[Saved] {outline_path}")
+        index = load_outline_index(project_path)
+        print(f"[Indexed] {len(index['chapters'])} chapters")
 
     except Exception as e:
         print(f"[Error] Failed to convert outline to JSON: {e}")
@@ -311,31 +623,401 @@ def approve_outline(project: str):
     path.write_text(json.dumps(meta, indent=4))
     print("[Approved] Outline locked in.")
 
-def summarize_chapter(project: str, chapter_number: int, model_override=None):
+def summarize_chapter(project: str, chapter_number: int, model_override=None, stream: bool = False, cache_mode: str = None,
+                      pages_per_chapter: int = 10, gates: dict = None, metrics=None):
+    """Summarize a finalized chapter hierarchically.
+
+    The chapter is split into page-sized chunks. Existing page summaries are
+    reused, the missing ones are summarized concurrently, and the results are
+    reduced (in groups of ``SUMMARY_REDUCE_FANIN``) into the chapter summary.
+    Returns where the summary was saved, or ``None`` if it failed.
+    """
     project_path = PROJECTS_DIR / project
-    chapter_dir = get_chapter_dir(project_path, chapter_number)
     context_path = project_path / "context"
     context_path.mkdir(exist_ok=True)
 
-    model_name = model_override or load_metadata(project_path)["models"]["primary"]
-    model = AIModel(model_name)
-    final_path = chapter_dir / f"chapter_{chapter_number}_final.md"
+    meta = load_metadata(project_path)
+    model_name = model_override or meta["models"]["primary"]
+    model = get_model(model_name)
+    store = open_store(project_path, meta)
 
-    if not final_path.exists():
+    full_text = store.read_chapter_final(chapter_number)
+    if full_text is None:
         print(f"[Error] Chapter {chapter_number} not finalized.")
+        store.close()
         return
 
-    full_text = final_path.read_text(encoding="utf-8")
+    gate = (gates or backend_gates())[backend_for(model_name)]
+    cache = open_cache(project_path, meta, cache_mode)
+    own_metrics = metrics is None
+    if own_metrics:
+        metrics = open_metrics(project_path, "summarize-chapter")
+    start = time.time()
+    try:
+        page_numbers = range((chapter_number - 1) * pages_per_chapter + 1, chapter_number * pages_per_chapter + 1)
+        chunks = chapter_chunks(store, chapter_number, page_numbers, full_text)
+        pending = [i for i, (_, summary, _) in enumerate(chunks) if not summary]
+        print(f"[Summarizing] Chapter {chapter_number}: {len(chunks)} chunks, {len(chunks) - len(pending)} page summaries reused")
+
+        texts = [chunks[i][2] for i in pending]
+        for i, summary in zip(pending, map_summaries(model, texts, chunk_summary_prompt, gate, cache, metrics)):
+            page, _, text = chunks[i]
+            chunks[i] = (page, summary, text)
+            if page is not None and summary:
+                store.write_summary(page, summary)
+
+        summary, duration, ttft = reduce_summaries(model, [c[1] for c in chunks], gate, cache, metrics, echo_token if stream else None)
+        if stream:
+            print(f"\n[Streamed] Chapter summary in {duration:.2f}s (first token {ttft}s)")
+        location = store.write_chapter_summary(chapter_number, summary.strip())
+        print(f"[Saved] {location} ({time.time() - start:.2f}s)")
+        return location
+    except Exception as e:
+        print(f"[Error] Chapter summary failed: {e}")
+    finally:
+        if cache:
+            cache.close()
+        if own_metrics:
+            metrics.close()
+        store.close()
+
+def chapter_chunks(store, chapter_number: int, page_numbers, full_text: str) -> list:
+    """Split a chapter into ``(page, existing_summary, text)`` chunks of at most ``SUMMARY_CHUNK_WORDS`` words.
+
+    Approved pages with a saved page summary become a single pre-summarized
+    chunk; chapters without page records fall back to splitting the final text.
+    """
+    def split(text):
+        words = text.split()
+        return [" ".join(words[i:i + SUMMARY_CHUNK_WORDS]) for i in range(0, len(words), SUMMARY_CHUNK_WORDS)]
+
+    chunks = []
+    for page, text, approved in store.chapter_pages(chapter_number, page_numbers):
+        if text is None or not approved:
+            continue
+        existing = store.read_summary(page)
+        if existing:
+            chunks.append((page, existing, text))
+            continue
+        pieces = split(text)
+        chunks.extend((page if len(pieces) == 1 else None, "", piece) for piece in pieces)
+    return chunks or [(None, "", piece) for piece in split(full_text)]
+
+def chunk_summary_prompt(text: str) -> str:
+    return (
+        "You are a novel assistant. Summarize this passage in 80–120 words, keeping names, "
+        "plot events and character changes in order.\n\n"
+        "PASSAGE:\n" + text
+    )
+
+def merge_summary_prompt(text: str) -> str:
+    return (
+        "You are a novel assistant. Merge these consecutive passage summaries into one summary "
+        "of at most 200 words, keeping events in order.\n\n"
+        "SUMMARIES:\n" + text
+    )
+
+def map_summaries(model, texts: list, make_prompt, gate, cache, metrics) -> list:
+    """Summarize ``texts`` concurrently (bounded by ``gate``), preserving order.
+
+    A failed chunk falls back to its opening words so one error never sinks the chapter.
+    """
+    def run(text):
+        with gate:
+            try:
+                summary, *_ = model.generate(make_prompt(text), min_words=60, max_tokens=400, cache=cache, metrics=metrics, max_continuations=0)
+                return summary.strip()
+            except Exception as e:
+                print(f"[Error] Chunk summary failed: {e}")
+                return " ".join(text.split()[:SUMMARY_MAX_WORDS])
+
+    if not texts:
+        return []
+    with ThreadPoolExecutor(max_workers=len(texts)) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, run, text) for text in texts]
+        return [future.result() for future in futures]
+
+def reduce_summaries(model, summaries: list, gate, cache, metrics, on_token=None):
+    """Merge chunk summaries level by level, then write the final chapter summary."""
+    while len(summaries) > SUMMARY_REDUCE_FANIN:
+        groups = ["\n\n".join(summaries[i:i + SUMMARY_REDUCE_FANIN]) for i in range(0, len(summaries), SUMMARY_REDUCE_FANIN)]
+        summaries = map_summaries(model, groups, merge_summary_prompt, gate, cache, metrics)
+
     prompt = (
         "You are a novel assistant. Summarize the chapter below into 1–3 concise paragraphs, capturing:\n"
         "- key plot points\n- character progressions\n- emerging themes\n\n"
-        "CHAPTER CONTENT:\n" + full_text
+        "The chapter is given as summaries of its consecutive sections.\n\n"
+        "CHAPTER SECTION SUMMARIES:\n" + "\n\n".join(f"{i + 1}. {s}" for i, s in enumerate(summaries))
+    )
+    with gate:
+        summary, _, duration, ttft = model.generate(prompt, min_words=200, on_token=on_token, cache=cache, metrics=metrics, max_continuations=0)
+    return summary, duration, ttft
+
+def summarize_book(project: str, model_override=None, cache_mode: str = None, pages_per_chapter: int = 10,
+                   workers: int = 4, max_in_flight: dict = None):
+    project_path = PROJECTS_DIR / project
+    meta = load_metadata(project_path)
+    store = open_store(project_path, meta)
+    chapters = [n for n in store.chapter_numbers() if store.read_chapter_final(n) is not None]
+    store.close()
+
+    gates = backend_gates(max_in_flight)
+    metrics = open_metrics(project_path, "summarize-book")
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, summarize_chapter, project, n, model_override, False, cache_mode, pages_per_chapter, gates, metrics)
+                   for n in chapters]
+        for future in futures:
+            future.result()
+    metrics.close()
+    print(f"[Complete] Summarized {len(chapters)} chapters in {time.time() - start:.2f}s")
+
+# ───────────────────────── Book Job ────────────────────────────────────
+def page_state(store, journal, chapter_number: int, page_number: int, upstream_changed: bool = False) -> str:
+    """What ``write-book`` does with a page: ``"pending"`` (generate it), ``"done"`` (skip it), ``"adopt"`` (keep it and
+    journal it) or ``"edited"`` (keep its draft but summarize and index it again).
+
+    A page is generated only when its draft or summary is missing, or when an
+    earlier page of its chapter changed in the same run. Finished pages that
+    were never journalled are adopted as they are; journalled drafts edited
+    or rewritten since (``write-chapter``, ``generate-page``, by hand) are kept,
+    but their summary no longer describes them.
+    """
+    draft = store.read_draft(chapter_number, page_number)
+    if not draft or not store.read_summary(page_number):
+        return "pending"
+    entry = journal.get("page", chapter_number, page_number)
+    if entry is None:
+        return "adopt"
+    if entry["draft"] != digest(draft):
+        return "edited"
+    return "pending" if upstream_changed else "done"
+
+def write_book(project: str, model_override=None, pages_per_chapter: int = 10, dry_run: bool = False, stream: bool = False,
+               cache_mode: str = None, context_budget: int = None, strategy: str = None, workers: int = BOOK_WORKERS, hedge_mode: str = None,
+               spread: bool = False):
+    """Write, approve and summarize every outline chapter, resuming from the job journal.
+
+    Pages form one dependency chain per chapter: each page needs the summary
+    of the page before it, and a chapter's opening needs only its outline
+    entry and the chapters that were finished before the run. Up to ``workers`` chapter chains run at once (each backend's
+    scheduler still caps its own requests), so a book takes about
+    ``chapters / workers`` chapter-times as long as the backend admits that
+    many requests at once. With ``spread`` the chapters are dealt round-robin
+    over the primary (or ``model_override``) and the other available models,
+    so backends with a low concurrency cap (Ollama) do not limit the whole
+    book. A failed step stops only its own chapter.
+
+    Only pages whose draft or summary is missing are generated, plus the
+    pages after them in the same chapter (their prompts depend on it);
+    finished pages that are unjournalled or edited outside ``write-book`` are
+    adopted, and an edited page is summarized and indexed again, which
+    regenerates the pages after it (see ``page_state``). Chapters
+    are re-assembled when their final is stale and re-summarized when the
+    final changed. With ``dry_run`` the pending model calls are listed and
+    nothing is written.
+    """
+    project_path = PROJECTS_DIR / project
+    if not (project_path / "project.json").exists():
+        print(f"[Error] Project '{project}' not found.")
+        return
+    meta = load_metadata(project_path)
+    if not meta.get("outline_approved", False):
+        print("[Blocked] Outline not approved.")
+        return
+    outline = load_outline_index(project_path, persist=not dry_run)["chapters"]
+    chapters = sorted(int(n) for n in outline)
+    if not chapters:
+        print("[Error] Outline has no chapters.")
+        return
+
+    store = open_store(project_path, meta)
+    journal = open_journal(project_path)
+    model_name = model_override or meta["models"]["primary"]
+    chain_models = [model_name] + ([m for m in meta["models"]["available"] if m != model_name] if spread else [])
+    budget = context_budget or meta.get("context_budget", DEFAULT_BUDGET)
+    cache = None if dry_run else open_cache(project_path, meta, cache_mode)
+    metrics = None if dry_run else open_metrics(project_path, "write-book")
+    strategy = summary_strategy(meta, strategy)
+    hedges = {m: None if dry_run else open_hedge(project_path, meta, m, hedge_mode) for m in chain_models}
+
+    def pages_of(chapter):
+        return range((chapter - 1) * pages_per_chapter + 1, chapter * pages_per_chapter + 1)
+
+    # Chapters finished before this run do not change while it runs, so every chain can recall them.
+    recall_pages = frozenset(
+        page for chapter in chapters
+        if store.final_is_current(chapter, pages_of(chapter)) and all(store.read_summary(page) for page in pages_of(chapter))
+        for page in pages_of(chapter)
     )
 
+    def write_chain(chapter):
+        """Run one chapter's steps in order; returns its step counts, or ``None`` if a step failed."""
+        counts = Counter()
+        page_numbers = pages_of(chapter)
+        model = chain_models[chapters.index(chapter) % len(chain_models)]
+        chapter_summary = outline[str(chapter)].get("summary", "")
+        session = Session()
+        upstream_changed = False
+        for page in page_numbers:
+            state = page_state(store, journal, chapter, page, upstream_changed)
+            # A chapter opening is written from the outline alone.
+            prev_summary = load_prev_summary(store, page) if page > page_numbers[0] else ""
+            if state == "edited":
+                # The pages after it were written from its old summary.
+                upstream_changed = True
+                if dry_run:
+                    print(f"[Pending] Chapter {chapter} page {page}: summarize edited draft")
+                    counts["edited"] += 1
+                    continue
+                print(f"[Adopted] Chapter {chapter} page {page}: draft changed outside write-book; keeping it")
+                draft = store.read_draft(chapter, page)
+                with store.batch(), _summary_lock:
+                    save_summary(draft, store, page, strategy, prev_summary)
+                    load_story_state(project_path).add_page(page, chapter, draft, store.read_summary(page))
+            if state != "pending":
+                if state != "done" and not dry_run:
+                    journal.record("page", chapter, page, model=None, draft=digest(store.read_draft(chapter, page)))
+                counts["reused"] += 1
+                # The retained context no longer ends where the next page begins.
+                session.reset()
+                continue
+            if dry_run:
+                print(f"[Pending] Chapter {chapter} page {page}: generate")
+                upstream_changed = True
+                counts["pending"] += 1
+                continue
+            upstream_changed = True
+            prompt = build_prompt(prev_summary, meta["premise"], page, project_path, chapter_summary, model, budget,
+                                  first_page=page_numbers[0], recall_pages=recall_pages, chapter_number=chapter)
+            result = generate_and_save_page(model, prompt, store, chapter, page, test_mode=False, stream=stream, cache=cache, metrics=metrics,
+                                            session=session, strategy=strategy, previous_summary=prev_summary, hedge=hedges[model])
+            if result is None:
+                print(f"[Stopped] Chapter {chapter} page {page} failed; rerun write-book to resume from here.")
+                return None
+            journal.record("page", chapter, page, model=result[2], draft=digest(store.read_draft(chapter, page)))
+            counts["generated"] += 1
+
+        # Pages still to be written will make the current final stale.
+        if counts["pending"] or not store.final_is_current(chapter, page_numbers):
+            if dry_run:
+                print(f"[Pending] Chapter {chapter}: approve, assemble and summarize")
+                counts["summaries"] += 1
+                return counts
+            store.approve_pages(chapter, page_numbers)
+            location, _ = build_chapter_final(store, chapter, page_numbers)
+            journal.record("approve", chapter, final=digest(store.read_chapter_final(chapter)))
+            print(f"[Approved] Chapter {chapter} -> {location}")
+
+        final_digest = digest(store.read_chapter_final(chapter))
+        entry = journal.get("summary", chapter)
+        if entry and entry["final"] == final_digest and store.read_chapter_summary(chapter):
+            return counts
+        if dry_run:
+            print(f"[Pending] Chapter {chapter}: summarize")
+            counts["summaries"] += 1
+            return counts
+        if summarize_chapter(project, chapter, model, stream, cache_mode, pages_per_chapter, metrics=metrics) is None:
+            print(f"[Stopped] Chapter {chapter} summary failed; rerun write-book to resume from here.")
+            return None
+        journal.record("summary", chapter, final=final_digest)
+        counts["summaries"] += 1
+        return counts
+
+    # A dry run makes no model calls; listing chapters one at a time keeps its output in order.
+    workers = 1 if dry_run else max(1, min(workers, len(chapters)))
+    totals, failed = Counter(), []
+    start = time.time()
+    print(f"[Writing Book] {len(chapters)} chapters x {pages_per_chapter} pages with {', '.join(chain_models)}, {workers} at a time{' (dry run)' if dry_run else ''}")
     try:
-        summary, *_ = model.generate(prompt, min_words=200)
-        summary_path = chapter_dir / f"chapter_{chapter_number}_summary.txt"
-        summary_path.write_text(summary.strip(), encoding="utf-8")
-        print(f"[Saved] {summary_path}")
-    except Exception as e:
-        print(f"[Error] Chapter summary failed: {e}")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {chapter: pool.submit(contextvars.copy_context().run, write_chain, chapter) for chapter in chapters}
+            for chapter, future in futures.items():
+                try:
+                    counts = future.result()
+                except Exception as e:
+                    print(f"[Error] Chapter {chapter}: {e}")
+                    counts = None
+                if counts is None:
+                    failed.append(chapter)
+                else:
+                    totals.update(counts)
+    finally:
+        if cache:
+            cache.close()
+        if metrics:
+            metrics.close()
+        store.close()
+
+    if dry_run:
+        print(f"[Dry Run] {totals['pending']} pages, {totals['edited']} edited page summaries and {totals['summaries']} chapter summaries pending, "
+              f"{totals['reused']} pages already done")
+        return
+    if failed:
+        print(f"[Stopped] {len(failed)} chapter(s) did not finish ({', '.join(map(str, failed))}); rerun write-book to resume them.")
+    print(f"[Complete] Book written in {time.time() - start:.2f}s: {totals['generated']} pages generated, "
+          f"{totals['reused']} reused, {totals['summaries']} chapters summarized")
+
+# ───────────────────────── Storage ─────────────────────────────────────
+def migrate_storage(project: str, target: str, force: bool = False):
+    """Copy the project into ``target`` storage and switch to it.
+
+    Migrating to the backend already in use would overwrite newer data with
+    the stale copy left behind by the last migration, so it needs ``force``.
+    """
+    project_path = PROJECTS_DIR / project
+    meta_path = project_path / "project.json"
+    if not meta_path.exists():
+        print(f"[Error] Project '{project}' not found.")
+        return
+    meta = load_metadata(project_path)
+    if meta.get("storage", "files") == target and not force:
+        print(f"[Error] Project '{project}' already uses {target} storage; migrating again would overwrite it with the "
+              f"older {'file layout' if target == 'sqlite' else 'plotforge.db'} copy (use --force to do it anyway).")
+        return
+
+    if target == "sqlite":
+        counts = import_files(project_path, meta)
+    else:
+        if not (project_path / "plotforge.db").exists():
+            print(f"[Error] Project '{project}' has no plotforge.db to export.")
+            return
+        counts = export_files(project_path)
+
+    meta["storage"] = target
+    meta_path.write_text(json.dumps(meta, indent=4))
+    detail = ", ".join(f"{n} {kind}" for kind, n in counts.items())
+    print(f"[Migrated] {project} now uses {target} storage ({detail})")
+
+def list_pages(project: str):
+    project_path = PROJECTS_DIR / project
+    store = open_store(project_path, load_metadata(project_path))
+    rows = store.list_pages()
+    store.close()
+
+    print(f"{'Chapter':>7}  {'Page':>5}  {'Words':>6}  {'Approved':<8}  Summary")
+    for chapter, page, words, approved, has_summary in rows:
+        print(f"{chapter:>7}  {page:>5}  {words:>6}  {'yes' if approved else 'no':<8}  {'yes' if has_summary else 'no'}")
+    print(f"[Pages] {len(rows)} drafts, {sum(r[2] for r in rows)} words")
+
+# ───────────────────────── Metrics ─────────────────────────────────────
+def show_stats(project: str, command: str = None, prometheus: str = None):
+    project_path = PROJECTS_DIR / project
+    stats = aggregate(load_records(project_path / METRICS_FILE, command))
+    if not stats:
+        print(f"[Stats] No model calls recorded for '{project}'.")
+        return
+
+    def fmt(value, unit="s"):
+        return f"{value:.2f}{unit}" if value is not None else "-"
+
+    width = max(len(m) for m in stats)
+    print(f"{'Model':<{width}}  {'Backend':<7}  {'Calls':>5}  {'Errors':>6}  {'Hedges':>6}  {'p50':>7}  {'p90':>7}  {'p99':>7}  {'TTFT p50':>8}  {'Tok/s':>7}  {'Prompt':>8}  {'Cached':>8}  {'Compl.':>8}")
+    for model, s in stats.items():
+        errors = s["calls"] - sum(s["outcomes"].get(o, 0) for o in ("ok", "cache_hit", "cancelled"))
+        print(f"{model:<{width}}  {s['backend']:<7}  {s['calls']:>5}  {errors:>6}  {s['hedges_won']:>6}  {fmt(s['latency_p50']):>7}  {fmt(s['latency_p90']):>7}  "
+              f"{fmt(s['latency_p99']):>7}  {fmt(s['ttft_p50']):>8}  {fmt(s['tokens_per_sec'], ''):>7}  {s['prompt_tokens']:>8}  {s['cached_tokens']:>8}  {s['completion_tokens']:>8}")
+
+    if prometheus:
+        write_prometheus(stats, Path(prometheus), project)
+        print(f"[Saved] {prometheus}")
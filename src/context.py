@@ -0,0 +1,155 @@
+import re
+from functools import lru_cache
+
+# Large enough that the stable prefix (everything but the VOLATILE_SHARE reserve), filled with
+# the outline's book- and chapter-level material, can pass OpenAI's 1024-token minimum for
+# prompt caching. Page-level sections have their own caps, so the uncached tail stays small.
+DEFAULT_BUDGET = 2048
+MIN_SECTION_TOKENS = 24
+
+# Section stability tiers, most stable first; prompts are laid out in this order.
+BOOK, CHAPTER, PAGE = 0, 1, 2
+# Share of the budget (after fixed text) always held back for page-level sections.
+VOLATILE_SHARE = 0.4
+
+# Rough characters-per-token by model family, used when no exact tokenizer is available.
+CHARS_PER_TOKEN = {"gpt": 4.0, "llama": 3.7, "mistral": 3.6, "qwen": 3.4, "gemma": 3.8, "default": 3.5}
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+def model_family(model_name: str) -> str:
+    name = (model_name or "").lower()
+    for family in CHARS_PER_TOKEN:
+        if family in name:
+            return family
+    return "default"
+
+@lru_cache(maxsize=None)
+def _tiktoken_encoding(model_name: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text: str, model_name: str = "") -> int:
+    """Token count for ``text`` under ``model_name``: exact for OpenAI models when tiktoken is installed, estimated otherwise."""
+    if not text:
+        return 0
+    family = model_family(model_name)
+    if family == "gpt":
+        encoding = _tiktoken_encoding(model_name)
+        if encoding is not None:
+            return len(encoding.encode(text))
+    return max(1, round(len(text) / CHARS_PER_TOKEN[family]))
+
+def compress(text: str) -> str:
+    """Cheap lossless-ish compression: collapse whitespace and drop repeated sentences."""
+    seen, kept = set(), []
+    for sentence in SENTENCE_END.split(" ".join(text.split())):
+        key = sentence.lower()
+        if key and key not in seen:
+            seen.add(key)
+            kept.append(sentence)
+    return " ".join(kept)
+
+def truncate(text: str, max_tokens: int, model_name: str = "") -> str:
+    """Cut ``text`` to at most ``max_tokens``, preferring to end on a sentence boundary."""
+    words = text.split()
+    while words and count_tokens(" ".join(words), model_name) > max_tokens:
+        ratio = max_tokens / count_tokens(" ".join(words), model_name)
+        words = words[:max(0, min(len(words) - 1, int(len(words) * ratio)))]
+    cut = " ".join(words)
+    if len(words) < len(text.split()):
+        sentences = SENTENCE_END.split(cut)
+        if len(sentences) > 1:
+            cut = " ".join(sentences[:-1])
+    return cut
+
+def take_lines(text: str, max_tokens: int, model_name: str = "") -> str:
+    """Keep whole lines of ``text`` from the top while they fit in ``max_tokens``."""
+    kept, used = [], 0
+    for line in text.splitlines():
+        cost = count_tokens(line + "\n", model_name)
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept)
+
+class Section:
+    """One labelled block of prompt context.
+
+    Lower ``priority`` numbers are packed first; ``stability`` (``BOOK``,
+    ``CHAPTER`` or ``PAGE``) says how often the text changes.
+    """
+
+    def __init__(self, name: str, text: str, priority: int, label: str = None, stability: int = PAGE):
+        self.name = name
+        self.text = text or ""
+        self.priority = priority
+        self.label = label
+        self.stability = stability
+        self.tokens = 0
+        self.original_tokens = 0
+        self.status = "full"
+
+    def render(self) -> str:
+        return f"{self.label}:\n{self.text}\n\n" if self.label else self.text
+
+def assemble(sections: list, budget: int, model_name: str = "", fixed: tuple = ()) -> list:
+    """Fit ``sections`` into ``budget`` tokens, highest priority first.
+
+    ``fixed`` strings (instructions and wrappers added around the sections) are
+    charged against the budget up front. Sections that do not fit are
+    compressed, then truncated; any left with fewer than
+    ``MIN_SECTION_TOKENS`` are dropped. Sections keep their original order.
+    """
+    remaining = budget - sum(count_tokens(text, model_name) for text in fixed)
+    for section in sorted(sections, key=lambda s: s.priority):
+        section.original_tokens = section.tokens = count_tokens(section.render(), model_name)
+        if section.tokens <= remaining:
+            remaining -= section.tokens
+            continue
+
+        section.text = compress(section.text)
+        section.tokens = count_tokens(section.render(), model_name)
+        section.status = "compressed"
+        if section.tokens > remaining:
+            overhead = count_tokens(section.render(), model_name) - count_tokens(section.text, model_name)
+            section.text = truncate(section.text, remaining - overhead, model_name) if remaining - overhead >= MIN_SECTION_TOKENS else ""
+            section.tokens = count_tokens(section.render(), model_name) if section.text else 0
+            section.status = "truncated" if section.text else "dropped"
+        remaining -= section.tokens
+    return [s for s in sections if s.text]
+
+def compile_prompt(sections: list, budget: int, model_name: str = "", fixed: tuple = ()):
+    """Pack ``sections`` so everything above page level forms a byte-identical prefix.
+
+    Returns ``(stable, volatile)`` section lists, each ordered most stable
+    first. Book- and chapter-level sections are packed into the budget minus a
+    fixed ``VOLATILE_SHARE`` reserve, so how they are compressed or truncated
+    never depends on the page-level text; page-level sections then get
+    whatever is left. Rendering ``stable`` before ``volatile`` lets provider
+    prompt caches and Ollama's prefix reuse skip the shared part on every page
+    of a chapter.
+    """
+    ordered = sorted(sections, key=lambda s: s.stability)
+    stable = [s for s in ordered if s.stability < PAGE]
+    volatile = [s for s in ordered if s.stability >= PAGE]
+    fixed_tokens = sum(count_tokens(text, model_name) for text in fixed)
+    reserve = int((budget - fixed_tokens) * VOLATILE_SHARE)
+    stable = assemble(stable, budget - reserve, model_name, fixed)
+    volatile = assemble(volatile, budget, model_name, fixed + tuple(s.render() for s in stable))
+    return stable, volatile
+
+def describe(sections: list, budget: int, fixed_tokens: int) -> str:
+    used = fixed_tokens + sum(s.tokens for s in sections)
+    parts = [f"fixed {fixed_tokens}"]
+    for s in sections:
+        note = "" if s.status == "full" else f" ({s.status} from {s.original_tokens})"
+        parts.append(f"{s.name} {s.tokens}{note}")
+    return f"{used}/{budget} tokens: " + ", ".join(parts)
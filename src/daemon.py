@@ -0,0 +1,256 @@
+import contextvars
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from argparse import Namespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from daemon_client import DAEMON_ADDRESS, DEFAULT_WORKERS, SERVER_NAME, parse_address
+
+MAX_FINISHED_JOBS = 100
+
+_current_job = contextvars.ContextVar("plotforge_job", default=None)
+
+# ───────────────────────── Jobs ────────────────────────────────────────
+class Job:
+    """One submitted CLI command and the output it has printed so far."""
+
+    def __init__(self, job_id: int, command: str, args: dict):
+        self.id = job_id
+        self.command = command
+        self.args = args
+        self.project = args.get("name")
+        self.status = "queued"
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.output = []
+        self._changed = threading.Condition()
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def emit(self, text: str):
+        with self._changed:
+            self.output.append(text)
+            self._changed.notify_all()
+
+    def finish(self, status: str, error: str = None):
+        with self._changed:
+            self.status, self.error, self.finished = status, error, time.time()
+            self._changed.notify_all()
+
+    def follow(self):
+        """Yield ``output`` events from the start of the job as they arrive, then a final ``done`` event."""
+        sent = 0
+        while True:
+            with self._changed:
+                while sent == len(self.output) and self.active:
+                    self._changed.wait()
+                chunks, sent = self.output[sent:], len(self.output)
+                done = not self.active
+            if chunks:
+                yield {"event": "output", "text": "".join(chunks)}
+            if done:
+                yield {"event": "done", **self.describe()}
+                return
+
+    def describe(self) -> dict:
+        end = self.finished or time.time()
+        return {
+            "id": self.id,
+            "command": self.command,
+            "project": self.project,
+            "status": self.status,
+            "error": self.error,
+            "waited": round((self.started or end) - self.submitted, 2),
+            "elapsed": round(end - self.started, 2) if self.started else None,
+        }
+
+class JobQueue:
+    """FIFO job queue that runs at most one job per project at a time.
+
+    Jobs for different projects overlap; jobs for the same project run in
+    submission order so they never race on its files.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._busy = set()
+        self._ready = threading.Condition()
+
+    def submit(self, command: str, args: dict) -> Job:
+        with self._ready:
+            job = Job(next(self._ids), command, args)
+            self.jobs[job.id] = job
+            self._ready.notify_all()
+        return job
+
+    def next(self) -> Job:
+        """Block until a queued job's project is free, then mark the job running."""
+        with self._ready:
+            while True:
+                job = next((j for j in self.jobs.values() if j.status == "queued" and j.project not in self._busy), None)
+                if job is not None:
+                    break
+                self._ready.wait()
+            job.status, job.started = "running", time.time()
+            self._busy.add(job.project)
+            return job
+
+    def done(self, job: Job, status: str, error: str = None):
+        job.finish(status, error)
+        with self._ready:
+            self._busy.discard(job.project)
+            finished = [j for j in self.jobs.values() if not j.active]
+            for old in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self.jobs[old.id]
+            self._ready.notify_all()
+
+    def get(self, job_id: int):
+        with self._ready:
+            return self.jobs.get(job_id)
+
+    def snapshot(self) -> list:
+        with self._ready:
+            return [job.describe() for job in self.jobs.values()]
+
+class JobOutput:
+    """``sys.stdout`` stand-in that sends what a job prints to that job; everything else goes to ``stream``."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text: str):
+        job = _current_job.get()
+        if job is None:
+            return self.stream.write(text)
+        job.emit(text)
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def _work(queue: JobQueue, run):
+    while True:
+        job = queue.next()
+        token = _current_job.set(job)
+        status, error = "ok", None
+        try:
+            run(Namespace(**job.args))
+        except Exception as e:
+            job.emit(traceback.format_exc())
+            status, error = "error", str(e)
+        finally:
+            _current_job.reset(token)
+        queue.done(job, status, error)
+        print(f"[Job {job.id}] {job.command} {job.project or ''} {status} ({job.describe()['elapsed']:.2f}s)")
+
+# ───────────────────────── Server ──────────────────────────────────────
+class DaemonHandler(BaseHTTPRequestHandler):
+    """``POST /jobs`` queues a command and streams its progress as NDJSON; ``GET /jobs/<id>`` re-attaches to it."""
+    server_version = SERVER_NAME
+
+    def do_GET(self):
+        queue = self.server.queue
+        if self.path == "/health":
+            self._json(self.server.health())
+        elif self.path == "/jobs":
+            self._json(queue.snapshot())
+        elif self.path.startswith("/jobs/") and self.path[6:].isdigit() and queue.get(int(self.path[6:])):
+            self._stream(queue.get(int(self.path[6:])))
+        else:
+            self._json({"error": f"not found: {self.path}"}, 404)
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            self._json({"error": f"not found: {self.path}"}, 404)
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            command, args = payload["command"], dict(payload["args"])
+        except (ValueError, KeyError, TypeError) as e:
+            self._json({"error": f"bad job: {e}"}, 400)
+            return
+        self._stream(self.server.queue.submit(command, args))
+
+    def _json(self, data, status: int = 200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, job: Job):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            self._send({"event": "queued", **job.describe()})
+            for event in job.follow():
+                self._send(event)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client detached; the job keeps running
+
+    def _send(self, event: dict):
+        self.wfile.write(json.dumps(event).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+class Daemon(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, run, workers: int = DEFAULT_WORKERS):
+        super().__init__(address, DaemonHandler)
+        self.queue = JobQueue()
+        self.workers = workers
+        self.started = time.time()
+        for i in range(workers):
+            threading.Thread(target=_work, args=(self.queue, run), name=f"plotforge-job-{i + 1}", daemon=True).start()
+
+    def health(self) -> dict:
+        from models import warm_models
+        jobs = self.queue.snapshot()
+        return {
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started, 1),
+            "workers": self.workers,
+            "queued": sum(j["status"] == "queued" for j in jobs),
+            "running": sum(j["status"] == "running" for j in jobs),
+            "models": warm_models(),
+        }
+
+def serve(run, address: str = DAEMON_ADDRESS, workers: int = DEFAULT_WORKERS, warm=()):
+    """Run the daemon until interrupted.
+
+    ``run`` executes one parsed CLI command. Model clients, outline indexes
+    and story state stay loaded between jobs; models in ``warm`` are loaded
+    before the first job arrives.
+    """
+    from models import get_model
+
+    for model_name in warm:
+        get_model(model_name).warm()
+    daemon = Daemon(parse_address(address), run, workers)
+    stdout, sys.stdout = sys.stdout, JobOutput(sys.stdout)
+    print(f"[Daemon] Listening on http://{address} ({workers} workers, pid {os.getpid()})")
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        print("[Daemon] Stopped")
+    finally:
+        daemon.server_close()
+        sys.stdout = stdout
@@ -0,0 +1,104 @@
+import json
+import os
+import socket
+
+# Where ``serve`` listens and where the CLI looks for it (host:port, localhost only by default).
+DAEMON_ADDRESS = os.getenv("PLOTFORGE_DAEMON", "127.0.0.1:8765")
+DEFAULT_WORKERS = 4
+CONNECT_TIMEOUT = 0.5
+
+# ``Server`` header the daemon answers with.
+SERVER_NAME = "PlotForge"
+
+# Commands that always run in the calling process (interactive, or managing the daemon itself).
+LOCAL_COMMANDS = {"new", "bench", "serve", "jobs"}
+# Arguments holding paths, resolved against the client's working directory before submitting.
+PATH_ARGS = ("output", "prometheus")
+
+def parse_address(address: str):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+# ───────────────────────── Client ──────────────────────────────────────
+def _connect(address: str):
+    """An HTTP connection to the PlotForge daemon at ``address``, or ``None`` if none is listening there."""
+    host, port = parse_address(address)
+    try:
+        sock = socket.create_connection((host, port), timeout=CONNECT_TIMEOUT)
+    except OSError:
+        return None
+    # http.client (and the email and ssl modules behind it) is only imported once something answers.
+    import http.client
+    probe = http.client.HTTPConnection(host, port, timeout=CONNECT_TIMEOUT)
+    probe.sock = sock
+    try:
+        # Whatever else listens on the port must not be sent commands.
+        probe.request("GET", "/health")
+        response = probe.getresponse()
+        ours = response.status == 200 and response.getheader("Server", "").startswith(SERVER_NAME) and "pid" in json.loads(response.read())
+    except (OSError, http.client.HTTPException, ValueError, TypeError):
+        ours = False
+    finally:
+        probe.close()
+    if not ours:
+        print(f"[Warning] {address} is not a PlotForge daemon; running locally")
+        return None
+    conn = http.client.HTTPConnection(host, port, timeout=CONNECT_TIMEOUT)
+    try:
+        conn.connect()
+    except OSError:
+        return None
+    conn.sock.settimeout(None)
+    return conn
+
+def _follow(response) -> dict:
+    """Echo a job's streamed output; returns its last event."""
+    event, job_id = {}, None
+    try:
+        for line in response:
+            event = json.loads(line)
+            if event["event"] == "output":
+                print(event["text"], end="", flush=True)
+            elif event["event"] == "queued":
+                job_id = event["id"]
+                if event["status"] == "queued":
+                    print(f"[Queued] Job {job_id} ({event['command']} {event['project'] or ''})")
+    except KeyboardInterrupt:
+        print(f"\n[Detached] Job {job_id} keeps running; follow it with: jobs --follow {job_id}")
+        return event
+    if event.get("status") == "error":
+        print(f"[Error] Job {event['id']} failed: {event['error']}")
+    return event
+
+def submit(command: str, args: dict, address: str = DAEMON_ADDRESS) -> bool:
+    """Run ``command`` on the daemon at ``address`` and stream its output; ``False`` if no daemon is listening."""
+    conn = _connect(address)
+    if conn is None:
+        return False
+    args = {k: os.path.abspath(v) if k in PATH_ARGS and v else v for k, v in args.items()}
+    conn.request("POST", "/jobs", json.dumps({"command": command, "args": args}), {"Content-Type": "application/json"})
+    try:
+        _follow(conn.getresponse())
+    except KeyboardInterrupt:
+        print("\n[Detached] The job keeps running; list jobs with: jobs")
+    conn.close()
+    return True
+
+def show_jobs(follow: int = None, address: str = DAEMON_ADDRESS):
+    conn = _connect(address)
+    if conn is None:
+        print(f"[Error] No PlotForge daemon at {address}")
+        return
+    conn.request("GET", f"/jobs/{follow}" if follow else "/jobs")
+    response = conn.getresponse()
+    if response.status != 200:
+        print(f"[Error] {json.loads(response.read()).get('error')}")
+    elif follow:
+        _follow(response)
+    else:
+        jobs = json.loads(response.read())
+        print(f"{'Job':>4}  {'Status':<8}  {'Command':<18}  {'Project':<16}  {'Elapsed':>8}")
+        for job in jobs:
+            elapsed = f"{job['elapsed']:.1f}s" if job["elapsed"] is not None else "-"
+            print(f"{job['id']:>4}  {job['status']:<8}  {job['command']:<18}  {job['project'] or '-':<16}  {elapsed:>8}")
+    conn.close()
@@ -0,0 +1,67 @@
+import html
+import os
+import shutil
+from pathlib import Path
+
+FORMATS = ("md", "txt", "xhtml")
+
+XHTML_PAGE = (
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '<!DOCTYPE html>\n'
+    '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">\n'
+    '<head><title>{title}</title></head>\n'
+    '<body>\n'
+)
+XHTML_END = "</body>\n</html>\n"
+
+def chapter_heading(number: int, title: str) -> str:
+    return f"Chapter {number}: {title}" if title else f"Chapter {number}"
+
+def iter_paragraphs(lines):
+    """Group an iterable of lines into paragraphs separated by blank lines, one paragraph at a time."""
+    paragraph = []
+    for line in lines:
+        if line.strip():
+            paragraph.append(line.strip())
+        elif paragraph:
+            yield " ".join(paragraph)
+            paragraph = []
+    if paragraph:
+        yield " ".join(paragraph)
+
+def _copy_chapter(store, chapter: int, out):
+    with store.open_chapter_final(chapter) as final:
+        shutil.copyfileobj(final, out)
+    out.write("\n\n")
+
+def export_text(store, chapters, out_path: Path, fmt: str, book_title: str) -> int:
+    """Stream every chapter's final text into one Markdown or plain-text file."""
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as out:
+        out.write(f"# {book_title}\n\n" if fmt == "md" else f"{book_title.upper()}\n\n")
+        for number, title in chapters:
+            heading = chapter_heading(number, title)
+            out.write(f"## {heading}\n\n" if fmt == "md" else f"{heading}\n\n")
+            _copy_chapter(store, number, out)
+    os.replace(tmp, out_path)
+    return len(chapters)
+
+def export_xhtml(store, chapters, out_dir: Path, book_title: str) -> int:
+    """Write one EPUB-ready ``chapter_N.xhtml`` per chapter plus a ``nav.xhtml`` table of contents."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for number, title in chapters:
+        heading = html.escape(chapter_heading(number, title))
+        with open(out_dir / f"chapter_{number}.xhtml", "w", encoding="utf-8") as out, store.open_chapter_final(number) as final:
+            out.write(XHTML_PAGE.format(title=heading))
+            out.write(f'<section epub:type="chapter" id="chapter-{number}">\n<h2>{heading}</h2>\n')
+            for paragraph in iter_paragraphs(final):
+                out.write(f"<p>{html.escape(paragraph.lstrip('#').strip())}</p>\n")
+            out.write("</section>\n" + XHTML_END)
+
+    with open(out_dir / "nav.xhtml", "w", encoding="utf-8") as nav:
+        nav.write(XHTML_PAGE.format(title=html.escape(book_title)))
+        nav.write(f'<nav epub:type="toc" id="toc">\n<h1>{html.escape(book_title)}</h1>\n<ol>\n')
+        for number, title in chapters:
+            nav.write(f'<li><a href="chapter_{number}.xhtml">{html.escape(chapter_heading(number, title))}</a></li>\n')
+        nav.write("</ol>\n</nav>\n" + XHTML_END)
+    return len(chapters)
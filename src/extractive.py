@@ -0,0 +1,138 @@
+import re
+from collections import Counter
+from functools import lru_cache
+
+SENTENCE_SPLIT = re.compile(r"(?:(?<=[.!?])|(?<=[.!?][\"'”’]))\s+")
+WORD = re.compile(r"[A-Za-z][A-Za-z'’-]*")
+NAME = re.compile(r"\b[A-Z][a-z]+(?:[ -][A-Z][a-z]+)*\b")
+
+STOPWORDS = frozenset(
+    "a an and are as at be been but by for from had has have he her hers him his i if in into is it its me my "
+    "no not of on or our she so than that the their them then there they this to up was we were what when "
+    "where which while who will with would you your nobody nothing someone something everyone everything "
+    "now yes here just still even only outside inside later suddenly meanwhile perhaps maybe finally".split()
+)
+
+DAMPING = 0.85
+ITERATIONS = 30
+ENTITY_BOOST = 0.5
+REDUNDANCY = 0.8
+MAX_ENTITIES = 8
+ENTITY_PREFIX = "Entities: "
+
+@lru_cache(maxsize=None)
+def numpy_available() -> bool:
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def split_sentences(text: str) -> list:
+    return [s.strip() for s in SENTENCE_SPLIT.split(" ".join(text.split())) if s.strip()]
+
+def find_names(text: str):
+    """Yield ``(offset, name)`` for capitalised runs, dropping a leading stopword ("Later Mara" -> "Mara")."""
+    for match in NAME.finditer(text):
+        words = match.group().split(" ")
+        offset = match.start()
+        while words and words[0].lower() in STOPWORDS:
+            offset += len(words.pop(0)) + 1
+        if words:
+            yield offset, " ".join(words)
+
+def extract_entities(text: str, known=()) -> list:
+    """Capitalised names, most frequent first.
+
+    Words that also occur in lower case are ordinary words, not names, and a
+    name seen only at sentence starts must appear twice (and not be a
+    stopword) unless it is already ``known``, so capitalised openers are not
+    mistaken for names.
+    """
+    common = {w for w in WORD.findall(text) if w.islower()}
+    initial, inner = Counter(), Counter()
+    for sentence in split_sentences(text):
+        for offset, name in find_names(sentence):
+            if " " not in name and "-" not in name and name.lower() in common:
+                continue
+            (initial if offset == 0 else inner)[name] += 1
+    counts = Counter({name: n + initial[name] for name, n in inner.items()})
+    for name, n in initial.items():
+        if name not in counts and (n > 1 or name in known) and name.lower() not in STOPWORDS:
+            counts[name] = n
+    return [name for name, _ in counts.most_common()]
+
+def carried_entities(previous_summary: str) -> list:
+    """Entities listed on the ``Entities:`` line of the previous page summary."""
+    for line in reversed((previous_summary or "").splitlines()):
+        if line.startswith(ENTITY_PREFIX):
+            return [name.strip() for name in line[len(ENTITY_PREFIX):].split(",") if name.strip()]
+    return []
+
+def score_sentences(sentences: list, boost_terms: set = frozenset()):
+    """TextRank over TF-IDF sentence vectors, weighted towards the end of the page and towards ``boost_terms``.
+
+    Returns ``(scores, similarity)`` where ``similarity`` is the sentence cosine-similarity matrix.
+    """
+    import numpy as np
+
+    tokens = [[w.lower() for w in WORD.findall(s) if w.lower() not in STOPWORDS] for s in sentences]
+    vocabulary = {w: i for i, w in enumerate(sorted({w for ws in tokens for w in ws}))}
+    n = len(sentences)
+    if not vocabulary:
+        return np.ones(n), np.zeros((n, n))
+
+    rows = np.fromiter((i for i, ws in enumerate(tokens) for _ in ws), dtype=np.intp)
+    cols = np.fromiter((vocabulary[w] for ws in tokens for w in ws), dtype=np.intp)
+    tf = np.zeros((n, len(vocabulary)))
+    np.add.at(tf, (rows, cols), 1.0)
+    idf = np.log((1 + n) / (1 + (tf > 0).sum(axis=0))) + 1
+    vectors = tf * idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+    similarity = vectors @ vectors.T
+    np.fill_diagonal(similarity, 0.0)
+    out_weight = similarity.sum(axis=1, keepdims=True)
+    transition = np.divide(similarity, out_weight, out=np.full_like(similarity, 1.0 / n), where=out_weight > 0)
+    rank = np.full(n, 1.0 / n)
+    for _ in range(ITERATIONS):
+        rank = (1 - DAMPING) / n + DAMPING * (transition.T @ rank)
+
+    position = 1 + 0.5 * np.arange(n) / max(1, n - 1)
+    lowered = [s.lower() for s in sentences]
+    mentions = np.array([sum(term in s for term in boost_terms) for s in lowered], dtype=float)
+    return rank * position * (1 + ENTITY_BOOST * np.minimum(mentions, 2)), similarity
+
+def summarize(text: str, max_words: int, previous_summary: str = "") -> str:
+    """Extractive page summary of at most ``max_words`` words plus an ``Entities:`` line.
+
+    The highest-scoring sentences are kept in page order, always including the
+    closing sentence the next page continues from and skipping near-duplicates
+    of sentences already chosen. Entities named on the
+    previous summary's ``Entities:`` line are boosted and, while the page
+    still mentions them, carried over onto this summary's line.
+    """
+    sentences = split_sentences(text)
+    if not sentences:
+        return ""
+    carried = carried_entities(previous_summary)
+    entities = extract_entities(text, set(carried))
+    scores, similarity = score_sentences(sentences, {e.lower() for e in carried + entities[:MAX_ENTITIES]})
+
+    lengths = [len(s.split()) for s in sentences]
+    chosen, used = {len(sentences) - 1}, lengths[-1]
+    for i in sorted(range(len(sentences)), key=lambda i: -scores[i]):
+        if i in chosen or used + lengths[i] > max_words:
+            continue
+        if all(similarity[i, j] < REDUNDANCY for j in chosen):
+            chosen.add(i)
+            used += lengths[i]
+    summary = " ".join(sentences[i] for i in sorted(chosen))
+    if used > max_words:
+        summary = " ".join(summary.split()[-max_words:])
+
+    names = [e for e in carried if e in text] + [e for e in entities if e not in carried]
+    if names:
+        summary += "\n" + ENTITY_PREFIX + ", ".join(names[:MAX_ENTITIES])
+    return summary
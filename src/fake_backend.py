@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+from context import count_tokens
+
+VOCABULARY = (
+    "the city glass rain signal archive memory ration tower lantern corridor engine voice silence "
+    "she he they walked listened waited remembered whispered watched counted broke opened closed "
+    "slowly quietly under above beyond through against before after while because although "
+    "cold bright hollow distant narrow restless patient brittle careful ancient electric"
+).split()
+
+# Prompt caching as OpenAI does it: nothing below 1024 shared tokens, then 128-token increments.
+CACHE_MIN_TOKENS = 1024
+CACHE_INCREMENT_TOKENS = 128
+
+class FakeBackendError(RuntimeError):
+    """Simulated backend failure (transient, so the scheduler retries it)."""
+    retryable = True
+
+class FakeClient:
+    """Deterministic stand-in for a model backend, selected with ``fake:<latency_ms>:<words>[:key=value...]``.
+
+    Options: ``jitter=<ms>`` (uniform +/- latency jitter), ``fail=<rate>``
+    (probability a call raises ``FakeBackendError``) and ``seed=<n>``. The text
+    depends only on the model name and prompt; latency and failures follow a
+    seeded per-client sequence so whole runs are reproducible.
+    """
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        parts = model_name.split(":")[1:]
+        positional = [p for p in parts if "=" not in p]
+        options = dict(p.split("=", 1) for p in parts if "=" in p)
+        self.latency = float(positional[0]) / 1000 if len(positional) > 0 else 0.0
+        self.words = int(positional[1]) if len(positional) > 1 else 500
+        self.jitter = float(options.get("jitter", 0)) / 1000
+        self.fail_rate = float(options.get("fail", 0))
+        self._timing = random.Random(int(options.get("seed", 0)))
+        self._lock = threading.Lock()
+        self._last_prompt = ""
+
+    def _next_call(self):
+        with self._lock:
+            latency = max(0.0, self.latency + self._timing.uniform(-self.jitter, self.jitter))
+            fails = self._timing.random() < self.fail_rate
+        return latency, fails
+
+    def cached_tokens(self, prompt: str) -> int:
+        """Tokens of ``prompt`` a provider prefix cache would serve from the prefix it shares with the previous prompt.
+
+        Like OpenAI's prompt caching, a shared prefix shorter than
+        ``CACHE_MIN_TOKENS`` earns nothing and longer ones are credited in
+        ``CACHE_INCREMENT_TOKENS`` steps.
+        """
+        with self._lock:
+            previous, self._last_prompt = self._last_prompt, prompt
+        shared = count_tokens(prompt[:len(os.path.commonprefix([previous, prompt]))], self.model_name)
+        if shared < CACHE_MIN_TOKENS:
+            return 0
+        return shared - (shared - CACHE_MIN_TOKENS) % CACHE_INCREMENT_TOKENS
+
+    def _text(self, prompt: str, max_tokens: int) -> str:
+        seed = int.from_bytes(hashlib.sha256(f"{self.model_name}\0{prompt}".encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        if "valid JSON" in prompt:
+            return self._outline_json(rng)
+
+        count = min(self.words, max(1, int(max_tokens * 0.75)))
+        sentences, words = [], 0
+        while words < count:
+            length = min(rng.randint(6, 18), count - words)
+            sentence = " ".join(rng.choice(VOCABULARY) for _ in range(length))
+            sentences.append(sentence[0].upper() + sentence[1:] + ".")
+            words += length
+        paragraphs = [" ".join(sentences[i:i + 5]) for i in range(0, len(sentences), 5)]
+        return "\n\n".join(paragraphs)
+
+    def _outline_json(self, rng) -> str:
+        chapters = [
+            {"title": f"Chapter {n}", "summary": " ".join(rng.choice(VOCABULARY) for _ in range(40)),
+             "structure": {"intro": "setup", "conflict": "pressure", "climax": "turn"}}
+            for n in range(1, 11)
+        ]
+        return json.dumps({"characters": [{"name": "Mara", "role": "lead", "traits": ["stubborn"]}],
+                           "setting": "a glass city", "theme": "memory", "key_scenes": ["the archive falls"],
+                           "chapters": chapters})
+
+    def generate(self, prompt: str, max_tokens: int) -> str:
+        latency, fails = self._next_call()
+        time.sleep(latency)
+        if fails:
+            raise FakeBackendError(f"simulated failure from {self.model_name}")
+        return self._text(prompt, max_tokens)
+
+    def stream(self, prompt: str, max_tokens: int):
+        latency, fails = self._next_call()
+        words = self._text(prompt, max_tokens).split(" ")
+        chunks = [" ".join(words[i:i + 8]) + " " for i in range(0, len(words), 8)]
+        time.sleep(latency * 0.25)
+        for i, chunk in enumerate(chunks):
+            if fails and i == len(chunks) // 2:
+                raise FakeBackendError(f"simulated failure from {self.model_name}")
+            yield chunk
+            time.sleep(latency * 0.75 / len(chunks))
@@ -0,0 +1,227 @@
+import contextvars
+import os
+import sys
+import threading
+import time
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+# Prompts padded into one generate() call, and how long an idle batcher waits for more to arrive.
+BATCH_SIZE = int(os.getenv("HF_BATCH_SIZE", "8"))
+BATCH_WINDOW = 0.02
+# Smallest model the smoke check (``python src/hf_backend.py [repo_id]``) can load.
+SMOKE_MODEL = "sshleifer/tiny-gpt2"
+
+SAMPLING = {"do_sample": True, "temperature": 0.8, "top_p": 0.95, "top_k": 50}
+
+_loaded = {}
+_load_lock = threading.Lock()
+
+def load_model(model_id: str, quantize: bool = False):
+    """Return ``(model, tokenizer, device)`` for ``model_id``, loading it once per process.
+
+    On CPU, ``quantize`` converts the linear layers to int8 with dynamic
+    quantization (ignored on GPU, where the model runs in float16).
+    """
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    quantize = quantize and device.type == "cpu"
+    key = (model_id, quantize)
+    with _load_lock:
+        if key not in _loaded:
+            print(f"[Model] Loading {model_id} on {device}{' (int8)' if quantize else ''}")
+            tokenizer = AutoTokenizer.from_pretrained(model_id, trust_remote_code=True)
+            # Decoder-only models continue from the right edge, so pad on the left.
+            tokenizer.padding_side = "left"
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+            model = AutoModelForCausalLM.from_pretrained(
+                model_id,
+                torch_dtype=torch.float16 if device.type == "cuda" else torch.float32,
+                trust_remote_code=True
+            ).to(device)
+            model.eval()
+            if quantize:
+                model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            _loaded[key] = (model, tokenizer, device)
+        return _loaded[key]
+
+class SequenceStop(StoppingCriteria):
+    """Per-sequence stopping: a row is finished once it has used its own token budget.
+
+    Finished rows stop growing while the rest of the batch carries on, and
+    ``generate`` returns as soon as every row is finished.
+    """
+
+    def __init__(self, prompt_length: int, budgets: list):
+        self.prompt_length = prompt_length
+        self.budgets = torch.tensor(budgets)
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.budgets.to(input_ids.device) <= input_ids.shape[1] - self.prompt_length
+
+class HFClient:
+    """In-process Hugging Face Transformers backend, selected with ``hf:<repo_id>[:int8]``.
+
+    ``generate_batch`` runs many prompts as left-padded batches of up to
+    ``BATCH_SIZE``, sorted by length to keep padding small. Concurrent
+    ``generate`` calls (summary chunks, chapter openings written in parallel)
+    are coalesced the same way: they queue, and a background batcher runs
+    whatever has arrived as one batch. ``:int8`` (or ``HF_QUANTIZE=int8``)
+    quantizes the model on CPU.
+    """
+
+    def __init__(self, model_name: str):
+        parts = model_name.split(":")
+        self.model_id = parts[1]
+        quantize = "int8" in parts[2:] or os.getenv("HF_QUANTIZE") == "int8"
+        self.model, self.tokenizer, self.device = load_model(self.model_id, quantize)
+        # A chat template already renders BOS and the other special tokens; adding them again would duplicate BOS.
+        self.templated = bool(getattr(self.tokenizer, "chat_template", None))
+        self._pending = []
+        self._cond = threading.Condition()
+        self._model_lock = threading.Lock()
+        self._batcher = None
+
+    def format(self, system: str, prompt: str) -> str:
+        """Render ``prompt`` with the model's chat template, if it has one."""
+        if not self.templated:
+            return f"{system}\n\n{prompt}\n\n"
+        messages = [{"role": "system", "content": system}, {"role": "user", "content": prompt}]
+        try:
+            return self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        except Exception:
+            # Some templates reject a system turn; fold it into the user turn.
+            messages = [{"role": "user", "content": f"{system}\n\n{prompt}"}]
+            return self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+    def _encode(self, prompts):
+        return self.tokenizer(prompts, return_tensors="pt", padding=True, add_special_tokens=not self.templated).to(self.device)
+
+    def generate_batch(self, prompts: list, max_tokens) -> list:
+        """Generate for every prompt; returns ``(text, prompt_tokens, completion_tokens)`` per prompt, in order.
+
+        ``max_tokens`` is one budget for all prompts or a list with one per prompt.
+        """
+        budgets = list(max_tokens) if isinstance(max_tokens, (list, tuple)) else [max_tokens] * len(prompts)
+        order = sorted(range(len(prompts)), key=lambda i: len(prompts[i]))
+        results = [None] * len(prompts)
+        for start in range(0, len(order), BATCH_SIZE):
+            rows = order[start:start + BATCH_SIZE]
+            for i, result in zip(rows, self._run_batch([prompts[i] for i in rows], [budgets[i] for i in rows])):
+                results[i] = result
+        return results
+
+    def _run_batch(self, prompts: list, budgets: list) -> list:
+        inputs = self._encode(prompts)
+        prompt_length = inputs["input_ids"].shape[1]
+        criteria = StoppingCriteriaList([SequenceStop(prompt_length, budgets)])
+        with self._model_lock, torch.inference_mode():
+            output = self.model.generate(
+                **inputs,
+                max_new_tokens=max(budgets),
+                stopping_criteria=criteria,
+                pad_token_id=self.tokenizer.pad_token_id,
+                **SAMPLING
+            )
+
+        results = []
+        for row, mask, budget in zip(output, inputs["attention_mask"], budgets):
+            generated = row[prompt_length:prompt_length + budget]
+            text = self.tokenizer.decode(generated, skip_special_tokens=True)
+            completion_tokens = int((generated != self.tokenizer.pad_token_id).sum())
+            results.append((text.strip(), int(mask.sum()), completion_tokens))
+        return results
+
+    def generate(self, prompt: str, max_tokens: int):
+        """One prompt, padded into a batch with any other prompts submitted meanwhile; returns ``(text, prompt_tokens, completion_tokens)``."""
+        request = {"prompt": prompt, "max_tokens": max_tokens, "done": threading.Event()}
+        with self._cond:
+            self._pending.append(request)
+            if self._batcher is None:
+                # The batcher serves every caller (and daemon job), so it runs in a fresh context rather than the
+                # first caller's; it prints nothing itself and hands results and errors back to each caller.
+                self._batcher = threading.Thread(target=contextvars.Context().run, args=(self._drain,), name=f"hf-batcher-{self.model_id}",
+                                                 daemon=True)
+                self._batcher.start()
+            self._cond.notify()
+        request["done"].wait()
+        if "error" in request:
+            raise request["error"]
+        return request["result"]
+
+    def _drain(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            # Requests that arrive while a batch runs join the next one; an idle batcher waits briefly for company.
+            time.sleep(BATCH_WINDOW)
+            with self._cond:
+                batch, self._pending = self._pending[:BATCH_SIZE], self._pending[BATCH_SIZE:]
+            try:
+                results = self.generate_batch([r["prompt"] for r in batch], [r["max_tokens"] for r in batch])
+                for request, result in zip(batch, results):
+                    request["result"] = result
+            except Exception as e:
+                for request in batch:
+                    request["error"] = e
+            for request in batch:
+                request["done"].set()
+
+    def stream(self, prompt: str, max_tokens: int, usage: dict):
+        """Yield text as it is generated (a batch of one)."""
+        inputs = self._encode(prompt)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        failure = []
+
+        def run():
+            try:
+                with self._model_lock, torch.inference_mode():
+                    self.model.generate(**inputs, max_new_tokens=max_tokens, streamer=streamer, pad_token_id=self.tokenizer.pad_token_id, **SAMPLING)
+            except Exception as e:
+                failure.append(e)
+                streamer.end()
+
+        thread = threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True)
+        thread.start()
+        pieces = []
+        for piece in streamer:
+            pieces.append(piece)
+            yield piece
+        thread.join()
+        if failure:
+            raise failure[0]
+        usage["prompt_tokens"] = int(inputs["attention_mask"].sum())
+        usage["completion_tokens"] = len(self.tokenizer("".join(pieces), add_special_tokens=False)["input_ids"])
+
+def smoke(model_id: str = SMOKE_MODEL):
+    """Run a tiny model through every path PlotForge uses: a sorted batch, coalesced concurrent calls and streaming."""
+    client = HFClient(f"hf:{model_id}")
+    prompt = client.format("You are a fiction-writing assistant.", "Write one sentence about a lighthouse.")
+    ids = client._encode(prompt)["input_ids"][0].tolist()
+    bos = client.tokenizer.bos_token_id
+    assert bos is None or ids[:2] != [bos, bos], "prompt starts with a duplicated BOS token"
+
+    budgets = [4, 12, 8]
+    results = client.generate_batch([prompt, prompt + " Make it eerie.", "Once"], budgets)
+    assert [c <= b for (_, _, c), b in zip(results, budgets)] == [True] * 3, results
+    print(f"[Smoke] batch of {len(results)}: {[completion for _, _, completion in results]} tokens for budgets {budgets}")
+
+    outputs = [None] * 4
+    threads = [threading.Thread(target=lambda i=i: outputs.__setitem__(i, client.generate(prompt, 6 + i))) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(completion <= 6 + i for i, (_, _, completion) in enumerate(outputs)), outputs
+    print(f"[Smoke] {len(outputs)} concurrent calls coalesced")
+
+    usage = {}
+    pieces = list(client.stream(prompt, 8, usage))
+    assert usage.get("prompt_tokens") == len(ids), usage
+    print(f"[Smoke] streamed {len(pieces)} pieces, usage {usage}")
+    print(f"[Smoke] {model_id} OK")
+
+if __name__ == "__main__":
+    smoke(*sys.argv[1:2])
@@ -0,0 +1,53 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+JOURNAL_FILE = "write_book.journal.jsonl"
+
+def digest(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:16]
+
+class JobJournal:
+    """Append-only record of completed ``write-book`` steps.
+
+    Each line is one finished step (``page``, ``approve`` or ``summary``) with
+    hashes of its inputs and outputs. Lines are fsynced as they are written, so
+    after a crash the journal never claims more than actually reached disk; a
+    half-written last line is ignored on load. The latest entry per step wins.
+    Safe to record from several threads.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.entries = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[self._key(entry["step"], entry["chapter"], entry.get("page"))] = entry
+
+    @staticmethod
+    def _key(step: str, chapter: int, page: int = None):
+        return step, chapter, page
+
+    def get(self, step: str, chapter: int, page: int = None):
+        return self.entries.get(self._key(step, chapter, page))
+
+    def record(self, step: str, chapter: int, page: int = None, **fields):
+        entry = {"ts": round(time.time(), 3), "step": step, "chapter": chapter, "page": page, **fields}
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries[self._key(step, chapter, page)] = entry
+
+def open_journal(project_path: Path) -> JobJournal:
+    return JobJournal(project_path / JOURNAL_FILE)
@@ -1,42 +1,89 @@
 import argparse
 from cli import (
     write_chapter,
+    write_book,
     generate_page,
     approve_chapter,
     summarize_chapter,
+    summarize_book,
     generate_outline,
     approve_outline,
     create_project,
     manage_models,
+    migrate_storage,
+    list_pages,
+    export_book,
+    show_stats,
+    BOOK_WORKERS,
+    SUMMARY_STRATEGIES,
 )
+from bench import DEFAULT_MODEL, DEFAULT_SIZES, run_bench
+from daemon_client import DAEMON_ADDRESS, DEFAULT_WORKERS, LOCAL_COMMANDS, show_jobs, submit
+from exporter import FORMATS
 
 def main():
     parser = argparse.ArgumentParser(description="PlotForge CLI")
+    parser.add_argument("--local", action="store_true", help="Run in this process even when a daemon is listening")
     subparsers = parser.add_subparsers(dest="command")
 
+    # Response cache overrides shared by every generating command
+    cache_parser = argparse.ArgumentParser(add_help=False)
+    cache_group = cache_parser.add_mutually_exclusive_group()
+    cache_group.add_argument("--cache", dest="cache_mode", action="store_const", const="on", help="Use the response cache for this run")
+    cache_group.add_argument("--no-cache", dest="cache_mode", action="store_const", const="off", help="Bypass the response cache")
+    cache_group.add_argument("--refresh", dest="cache_mode", action="store_const", const="refresh", help="Regenerate and overwrite cached responses")
+
+    # Hedging overrides for page-writing commands
+    hedge_parser = argparse.ArgumentParser(add_help=False)
+    hedge_group = hedge_parser.add_mutually_exclusive_group()
+    hedge_group.add_argument("--hedge", dest="hedge_mode", action="store_const", const="on", help="Back up slow page requests with a secondary model")
+    hedge_group.add_argument("--no-hedge", dest="hedge_mode", action="store_const", const="off", help="Never hedge page requests")
+
     # New project
     subparsers.add_parser("new").add_argument("name")
 
     # Outline
-    outline_parser = subparsers.add_parser("generate-outline")
+    outline_parser = subparsers.add_parser("generate-outline", parents=[cache_parser])
     outline_parser.add_argument("name")
     outline_parser.add_argument("--model")
+    outline_parser.add_argument("--stream", action="store_true")
 
     subparsers.add_parser("approve-outline").add_argument("name")
 
     # Write chapter (full generation)
-    write_parser = subparsers.add_parser("write-chapter")
+    write_parser = subparsers.add_parser("write-chapter", parents=[cache_parser, hedge_parser])
     write_parser.add_argument("name")
     write_parser.add_argument("--number", type=int, required=True)
     write_parser.add_argument("--pages", type=int, default=10)
     write_parser.add_argument("--model")
+    write_parser.add_argument("--stream", action="store_true")
+    write_parser.add_argument("--context-budget", type=int, help="Token budget for page context")
+    write_parser.add_argument("--summary-strategy", choices=SUMMARY_STRATEGIES, help="How page summaries are made (default from project.json)")
+
+    # Write the whole book, resuming from the job journal
+    book_parser = subparsers.add_parser("write-book", parents=[cache_parser, hedge_parser])
+    book_parser.add_argument("name")
+    book_parser.add_argument("--pages", type=int, default=10, help="Pages per chapter")
+    book_parser.add_argument("--model")
+    book_parser.add_argument("--stream", action="store_true")
+    book_parser.add_argument("--context-budget", type=int, help="Token budget for page context")
+    book_parser.add_argument("--summary-strategy", choices=SUMMARY_STRATEGIES, help="How page summaries are made (default from project.json)")
+    book_parser.add_argument("--workers", type=int, default=BOOK_WORKERS, help="Chapters written concurrently")
+    book_parser.add_argument("--spread", action="store_true", help="Deal chapters round-robin over every available model")
+    book_parser.add_argument("--dry-run", action="store_true", help="List pending model calls without running them")
 
     # Generate a single page
-    gen_page_parser = subparsers.add_parser("generate-page")
+    gen_page_parser = subparsers.add_parser("generate-page", parents=[cache_parser, hedge_parser])
     gen_page_parser.add_argument("name")
     gen_page_parser.add_argument("--number", type=int, required=True)
     gen_page_parser.add_argument("--model")
     gen_page_parser.add_argument("--pages", type=int, default=10)
+    gen_page_parser.add_argument("--test-models", action="store_true")
+    gen_page_parser.add_argument("--stream", action="store_true")
+    gen_page_parser.add_argument("--context-budget", type=int, help="Token budget for page context")
+    gen_page_parser.add_argument("--summary-strategy", choices=SUMMARY_STRATEGIES, help="How page summaries are made (default from project.json)")
+    gen_page_parser.add_argument("--max-openai", type=int, help="Max concurrent OpenAI requests with --test-models")
+    gen_page_parser.add_argument("--max-ollama", type=int, help="Max concurrent Ollama requests with --test-models")
 
     # Approve a chapter
     approve_parser = subparsers.add_parser("approve-chapter")
@@ -45,37 +92,117 @@ def main():
     approve_parser.add_argument("--pages", type=int, default=10)
 
     # Summarize a chapter
-    summarize_parser = subparsers.add_parser("summarize-chapter")
+    summarize_parser = subparsers.add_parser("summarize-chapter", parents=[cache_parser])
     summarize_parser.add_argument("name")
     summarize_parser.add_argument("--number", type=int, required=True)
     summarize_parser.add_argument("--model")
+    summarize_parser.add_argument("--stream", action="store_true")
+    summarize_parser.add_argument("--pages", type=int, default=10)
+
+    # Summarize every finalized chapter in parallel
+    summarize_book_parser = subparsers.add_parser("summarize-book", parents=[cache_parser])
+    summarize_book_parser.add_argument("name")
+    summarize_book_parser.add_argument("--model")
+    summarize_book_parser.add_argument("--pages", type=int, default=10)
+    summarize_book_parser.add_argument("--workers", type=int, default=4)
 
     # Model management
     models_parser = subparsers.add_parser("models")
     models_parser.add_argument("name")
     models_parser.add_argument("--list", action="store_true")
     models_parser.add_argument("--set", dest="set_primary")
+    models_parser.add_argument("--refresh", action="store_true", help="re-list the models each backend serves and add new ones")
+
+    # Export the whole book
+    export_parser = subparsers.add_parser("export-book")
+    export_parser.add_argument("name")
+    export_parser.add_argument("--format", choices=FORMATS, default="md")
+    export_parser.add_argument("--output")
+    export_parser.add_argument("--pages", type=int, default=10)
+
+    # Storage backend
+    migrate_parser = subparsers.add_parser("migrate")
+    migrate_parser.add_argument("name")
+    migrate_parser.add_argument("--to", choices=["sqlite", "files"], required=True)
+    migrate_parser.add_argument("--force", action="store_true", help="Migrate even if the project already uses this storage")
+
+    subparsers.add_parser("list-pages").add_argument("name")
+
+    # Per-model call statistics
+    stats_parser = subparsers.add_parser("stats")
+    stats_parser.add_argument("name")
+    stats_parser.add_argument("--command", dest="command_filter", help="Only include calls made by this command, e.g. write-chapter")
+    stats_parser.add_argument("--prometheus", help="Also write a Prometheus text-format file to this path")
+
+    # End-to-end benchmark on the fake backend
+    bench_parser = subparsers.add_parser("bench")
+    bench_parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated CHAPTERSxPAGES book sizes")
+    bench_parser.add_argument("--model", default=DEFAULT_MODEL, help="Model to drive, normally fake:<latency_ms>:<words>[:jitter=ms][:fail=rate][:seed=n]")
+    bench_parser.add_argument("--storage", choices=["files", "sqlite"], default="files")
+    bench_parser.add_argument("--json", dest="json_path", help="Write the JSON report to this path ('-' for stdout)")
+    bench_parser.add_argument("--verbose", action="store_true")
+
+    # Long-running daemon with warm model clients; other commands are sent to it when it is up
+    serve_parser = subparsers.add_parser("serve")
+    serve_parser.add_argument("--address", default=DAEMON_ADDRESS, help="host:port to listen on (default from PLOTFORGE_DAEMON)")
+    serve_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Jobs run at once (one per project)")
+    serve_parser.add_argument("--warm", action="append", default=[], metavar="MODEL", help="Load this model before the first job")
+
+    jobs_parser = subparsers.add_parser("jobs")
+    jobs_parser.add_argument("--follow", type=int, metavar="ID", help="Stream a job's output from the start")
 
     args = parser.parse_args()
 
+    if args.command is None:
+        parser.print_help()
+    elif args.command == "serve":
+        # The HTTP server is only imported by the process that runs it.
+        from daemon import serve
+        serve(run_command, args.address, args.workers, args.warm)
+    elif args.command == "jobs":
+        show_jobs(args.follow)
+    elif args.local or args.command in LOCAL_COMMANDS or not submit(args.command, vars(args)):
+        run_command(args)
+
+def run_command(args):
+    """Execute one parsed command, here or on behalf of a daemon client."""
     if args.command == "new":
         create_project(args.name)
     elif args.command == "generate-outline":
-        generate_outline(args.name, args.model)
+        generate_outline(args.name, args.model, stream=args.stream, cache_mode=args.cache_mode)
     elif args.command == "approve-outline":
         approve_outline(args.name)
     elif args.command == "write-chapter":
-        write_chapter(args.name, args.number, total_pages=args.pages, model_override=args.model, pages_per_chapter=args.pages)
+        write_chapter(args.name, args.number, total_pages=args.pages, model_override=args.model, pages_per_chapter=args.pages, stream=args.stream, cache_mode=args.cache_mode,
+                      context_budget=args.context_budget, strategy=args.summary_strategy, hedge_mode=args.hedge_mode)
+    elif args.command == "write-book":
+        write_book(args.name, args.model, pages_per_chapter=args.pages, dry_run=args.dry_run, stream=args.stream,
+                   cache_mode=args.cache_mode, context_budget=args.context_budget, strategy=args.summary_strategy, workers=args.workers,
+                   hedge_mode=args.hedge_mode, spread=args.spread)
     elif args.command == "generate-page":
-        generate_page(args.name, args.number, model_override=args.model, pages_per_chapter=args.pages)
+        max_in_flight = {k: v for k, v in (("openai", args.max_openai), ("ollama", args.max_ollama)) if v}
+        generate_page(args.name, args.number, model_override=args.model, test_models=args.test_models,
+                      pages_per_chapter=args.pages, max_in_flight=max_in_flight, stream=args.stream, cache_mode=args.cache_mode,
+                      context_budget=args.context_budget, strategy=args.summary_strategy, hedge_mode=args.hedge_mode)
     elif args.command == "approve-chapter":
         approve_chapter(args.name, args.number, pages_per_chapter=args.pages)
     elif args.command == "summarize-chapter":
-        summarize_chapter(args.name, args.number, args.model)
+        summarize_chapter(args.name, args.number, args.model, stream=args.stream, cache_mode=args.cache_mode,
+                          pages_per_chapter=args.pages)
+    elif args.command == "summarize-book":
+        summarize_book(args.name, args.model, cache_mode=args.cache_mode, pages_per_chapter=args.pages, workers=args.workers)
     elif args.command == "models":
-        manage_models(args.name, list_flag=args.list, set_primary=args.set_primary)
-    else:
-        parser.print_help()
+        manage_models(args.name, list_flag=args.list, set_primary=args.set_primary, refresh=args.refresh)
+    elif args.command == "export-book":
+        export_book(args.name, fmt=args.format, output=args.output, pages_per_chapter=args.pages)
+    elif args.command == "stats":
+        show_stats(args.name, args.command_filter, args.prometheus)
+    elif args.command == "bench":
+        run_bench(args.sizes, args.model, args.storage, args.json_path, args.verbose)
+    elif args.command == "migrate":
+        migrate_storage(args.name, args.to, args.force)
+    elif args.command == "list-pages":
+        list_pages(args.name)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,135 @@
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+METRICS_FILE = "metrics.jsonl"
+FLUSH_EVERY = 20
+
+class MetricsRecorder:
+    """Buffered, append-only JSONL log of per-call model metrics for one project.
+
+    Records are held in memory and appended ``FLUSH_EVERY`` at a time (and on
+    ``close``), so a run costs one file open per batch rather than per call.
+    """
+
+    def __init__(self, path: Path, command: str = ""):
+        self.path = Path(path)
+        self.command = command
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def record(self, **fields):
+        entry = {"ts": round(time.time(), 3), "command": self.command, **fields}
+        with self._lock:
+            self._buffer.append(entry)
+            due = len(self._buffer) >= FLUSH_EVERY
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._buffer = self._buffer, []
+            if pending:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(entry) + "\n" for entry in pending))
+
+    def close(self):
+        self.flush()
+
+def open_metrics(project_path: Path, command: str) -> MetricsRecorder:
+    return MetricsRecorder(project_path / METRICS_FILE, command)
+
+def load_records(path: Path, command: str = None):
+    if not path.exists():
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if command is None or entry.get("command") == command:
+                yield entry
+
+def percentile(values: list, pct: float):
+    """Nearest-rank percentile of ``values`` (``None`` when empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(pct / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+def aggregate(records) -> dict:
+    """Group records by model into call counts, latency/TTFT percentiles, throughput and token totals.
+
+    ``hedge`` records are not calls; they count towards the winning model's ``hedges_won``.
+    """
+    groups = defaultdict(list)
+    hedges = defaultdict(int)
+    for entry in records:
+        if entry.get("outcome") == "hedge":
+            hedges[entry.get("model", "?")] += 1
+            continue
+        groups[entry.get("model", "?")].append(entry)
+
+    stats = {}
+    for model, entries in sorted(groups.items()):
+        served = [e for e in entries if e.get("outcome") == "ok"]
+        latencies = [e["latency"] for e in served if e.get("latency") is not None]
+        ttfts = [e["ttft"] for e in served if e.get("ttft") is not None]
+        rates = [e["tokens_per_sec"] for e in served if e.get("tokens_per_sec")]
+        outcomes = defaultdict(int)
+        for e in entries:
+            outcomes[e.get("outcome", "?")] += 1
+        stats[model] = {
+            "backend": entries[-1].get("backend", "?"),
+            "calls": len(entries),
+            "outcomes": dict(outcomes),
+            "latency_p50": percentile(latencies, 50),
+            "latency_p90": percentile(latencies, 90),
+            "latency_p99": percentile(latencies, 99),
+            "ttft_p50": percentile(ttfts, 50),
+            "ttft_p90": percentile(ttfts, 90),
+            "tokens_per_sec": round(sum(rates) / len(rates), 2) if rates else None,
+            "prompt_tokens": sum(e.get("prompt_tokens") or 0 for e in entries),
+            "completion_tokens": sum(e.get("completion_tokens") or 0 for e in entries),
+            "cached_tokens": sum(e.get("cached_tokens") or 0 for e in entries),
+            "hedges_won": hedges[model],
+        }
+    return stats
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+def write_prometheus(stats: dict, path: Path, project: str):
+    """Write ``stats`` in the Prometheus text exposition format (for node_exporter's textfile collector)."""
+    lines = [
+        "# HELP plotforge_llm_calls_total Model calls by outcome.",
+        "# TYPE plotforge_llm_calls_total counter",
+    ]
+    for model, s in stats.items():
+        for outcome, count in s["outcomes"].items():
+            lines.append(f'plotforge_llm_calls_total{{project="{_label(project)}",model="{_label(model)}",backend="{s["backend"]}",outcome="{_label(outcome)}"}} {count}')
+    lines += ["# HELP plotforge_llm_hedges_won_total Hedged requests this model won.", "# TYPE plotforge_llm_hedges_won_total counter"]
+    for model, s in stats.items():
+        lines.append(f'plotforge_llm_hedges_won_total{{project="{_label(project)}",model="{_label(model)}"}} {s["hedges_won"]}')
+    lines += ["# HELP plotforge_llm_latency_seconds Call latency quantiles.", "# TYPE plotforge_llm_latency_seconds gauge"]
+    for model, s in stats.items():
+        for q in ("50", "90", "99"):
+            if s[f"latency_p{q}"] is not None:
+                lines.append(f'plotforge_llm_latency_seconds{{project="{_label(project)}",model="{_label(model)}",quantile="0.{q}"}} {s[f"latency_p{q}"]}')
+    lines += ["# HELP plotforge_llm_tokens_per_second Mean completion throughput.", "# TYPE plotforge_llm_tokens_per_second gauge"]
+    for model, s in stats.items():
+        if s["tokens_per_sec"] is not None:
+            lines.append(f'plotforge_llm_tokens_per_second{{project="{_label(project)}",model="{_label(model)}"}} {s["tokens_per_sec"]}')
+    lines += ["# HELP plotforge_llm_tokens_total Tokens processed.", "# TYPE plotforge_llm_tokens_total counter"]
+    for model, s in stats.items():
+        for kind in ("prompt", "completion", "cached"):
+            lines.append(f'plotforge_llm_tokens_total{{project="{_label(project)}",model="{_label(model)}",kind="{kind}"}} {s[f"{kind}_tokens"]}')
+
+    tmp = Path(path).with_name(Path(path).name + ".tmp")
+    tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    tmp.replace(path)
@@ -1,75 +1,495 @@
+import contextvars
+import hashlib
 import time
 import os
-import ollama
-import openai
-from dotenv import load_dotenv
-load_dotenv()
+import threading
+from collections import defaultdict, deque
+from backends import backend_for, get_backend, get_client, load_env
+from context import count_tokens
+from metrics import percentile
+from scheduler import get_scheduler
+
+# How long Ollama keeps a model resident after a request (Ollama duration string, overridden by OLLAMA_KEEP_ALIVE).
+DEFAULT_KEEP_ALIVE = "30m"
+
+SYSTEM_PROMPT = "You are a fiction-writing assistant."
+STORY_WRAPPER = "You are an expert fiction author. Write the beginning of a novel chapter in a compelling, immersive style.\n\n"
+
+CONTINUE_PROMPT = "Continue writing the next section of the chapter, keeping style, tone, and narrative flow consistent."
+
+# Backends that hand back their KV context, and how much of it a session keeps.
+CONTEXT_BACKENDS = {"ollama"}
+MAX_CONTINUATIONS = 2
+DEFAULT_SESSION_TOKENS = 8192
+# Context window requested from Ollama (overridden by OLLAMA_NUM_CTX); its own default is far smaller than a session.
+DEFAULT_NUM_CTX = 8192
+
+# Hedging: deadline percentile, samples needed before hedging, and samples kept per model.
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 10
+HEDGE_WINDOW = 100
+
+_models = {}
+_registry_lock = threading.Lock()
+
+def get_model(model_name: str) -> "AIModel":
+    """Return the cached ``AIModel`` for ``model_name``, creating it on first use."""
+    with _registry_lock:
+        model = _models.get(model_name)
+    if model is None:
+        model = AIModel(model_name)
+        with _registry_lock:
+            model = _models.setdefault(model_name, model)
+    return model
+
+def warm_models() -> list:
+    """Names of the models whose clients this process already holds."""
+    with _registry_lock:
+        return sorted(_models)
+
+class Session:
+    """KV context carried between consecutive calls to one model (e.g. the pages of a chapter).
+
+    Once the context grows past ``max_tokens`` it is dropped and the next call
+    starts from its prompt alone, before it would overflow the model window.
+    """
+
+    def __init__(self, max_tokens: int = None):
+        load_env()
+        self.max_tokens = max_tokens or int(os.getenv("OLLAMA_SESSION_TOKENS", DEFAULT_SESSION_TOKENS))
+        self.context = None
+
+    def update(self, context):
+        self.context = list(context) if context and len(context) <= self.max_tokens else None
+
+    def reset(self):
+        self.context = None
+
+    def digest(self) -> str:
+        return hashlib.sha256(",".join(map(str, self.context or ())).encode("ascii")).hexdigest()[:16]
+
+class HedgeCancelled(Exception):
+    """Raised inside the losing request of a hedged pair to abandon its stream."""
+
+class HedgePolicy:
+    """Back up slow calls with a request to a secondary model.
+
+    If the primary model has produced no output by the ``pct``-th percentile
+    of its recent time-to-first-token (its full latency while too few streamed
+    calls are known), the same prompt also goes to ``secondary``. The first
+    good result wins; the other request is abandoned at its next token and
+    recorded as ``cancelled``. Hedges that fire are logged to metrics as
+    ``hedge`` records naming the winner. History comes from ``metrics.jsonl``
+    and is kept current from the calls made through the policy.
+    """
+
+    def __init__(self, secondary: str, pct: float = HEDGE_PERCENTILE, min_samples: int = HEDGE_MIN_SAMPLES, history=()):
+        self.secondary = secondary
+        self.pct = pct
+        self.min_samples = min_samples
+        self._ttfts = defaultdict(lambda: deque(maxlen=HEDGE_WINDOW))
+        self._latencies = defaultdict(lambda: deque(maxlen=HEDGE_WINDOW))
+        self._lock = threading.Lock()
+        for entry in history:
+            self.observe(**entry)
+
+    def observe(self, model: str = None, outcome: str = None, ttft: float = None, latency: float = None, **_):
+        if outcome != "ok" or model is None:
+            return
+        with self._lock:
+            if ttft is not None:
+                self._ttfts[model].append(ttft)
+            if latency is not None:
+                self._latencies[model].append(latency)
+
+    def deadline(self, model_name: str):
+        """Seconds to wait for ``model_name``'s first output before hedging, or ``None`` without enough history."""
+        with self._lock:
+            for samples in (self._ttfts[model_name], self._latencies[model_name]):
+                if len(samples) >= self.min_samples:
+                    return percentile(list(samples), self.pct)
+        return None
+
+    def generate(self, model: "AIModel", prompt: str, on_token=None, session=None, metrics=None, **kwargs):
+        """``model.generate`` with hedging; returns ``(text, word_count, elapsed, ttft, winner)``."""
+        start_time = time.time()
+        primary = model.model_name
+        recorder = _ObservedMetrics(self, metrics)
+        deadline = self.deadline(primary)
+        if deadline is None or self.secondary == primary:
+            return (*model.generate(prompt, on_token=on_token or _ignore, session=session, metrics=recorder, **kwargs), primary)
+
+        race = threading.Condition()
+        results = {}
+        first_output = {}
+        winner = None
+        hedged = False
+        live = False
+
+        def watch(name, forward):
+            def on_piece(piece):
+                nonlocal live
+                with race:
+                    if winner not in (None, name):
+                        raise HedgeCancelled(f"{name} lost the hedge to {winner}")
+                    first_output.setdefault(name, time.time())
+                    if forward and not hedged:
+                        live = True
+                        race.notify_all()
+                if live and on_token:
+                    on_token(piece)
+            return on_piece
+
+        def run(candidate, candidate_session, on_piece):
+            try:
+                result = candidate.generate(prompt, on_token=on_piece, session=candidate_session, metrics=recorder, **kwargs)
+            except Exception as e:
+                result = e
+            with race:
+                results[candidate.model_name] = result
+                race.notify_all()
+
+        def good(name):
+            result = results.get(name)
+            return isinstance(result, tuple) and bool(result[0].strip())
+
+        # The primary works on a copy of the session, adopted only if it wins.
+        trial = None
+        if session is not None:
+            trial = Session(session.max_tokens)
+            trial.context = session.context
+        # Both requests run in the caller's context, so what they print stays with the caller (e.g. its daemon job).
+        threading.Thread(target=contextvars.copy_context().run, args=(run, model, trial, watch(primary, True)), daemon=True).start()
+        with race:
+            race.wait_for(lambda: live or primary in results, timeout=deadline)
+            hedged = not live and primary not in results
+        names = [primary]
+        if hedged:
+            print(f"[Hedge] {primary} silent after {deadline:.2f}s (p{self.pct:g}); also trying {self.secondary}")
+            names.append(self.secondary)
+            threading.Thread(target=contextvars.copy_context().run, args=(run, get_model(self.secondary), None, watch(self.secondary, False)),
+                             daemon=True).start()
+
+        with race:
+            race.wait_for(lambda: any(good(n) for n in names) or all(n in results for n in names))
+            winner = next((n for n in names if good(n)), None)
+        if winner is None:
+            error = results[primary]
+            raise error if isinstance(error, Exception) else RuntimeError(f"[Model Error] {primary} returned no text")
+
+        if session is not None:
+            if winner == primary:
+                session.update(trial.context)
+            else:
+                session.reset()
+        text, words, _, ttft = results[winner]
+        if winner in first_output:
+            ttft = round(first_output[winner] - start_time, 2)
+        if hedged:
+            waited = round(time.time() - start_time, 3)
+            loser = names[1] if winner == primary else primary
+            print(f"[Hedge] {winner} won after {waited:.2f}s; cancelling {loser}")
+            if winner != primary:
+                # Censored sample: the primary took at least this long, so slow spells raise the deadline.
+                self.observe(model=primary, outcome="ok", ttft=waited)
+            if metrics:
+                metrics.record(model=winner, backend=backend_for(winner), outcome="hedge", primary=primary, secondary=self.secondary,
+                               deadline=round(deadline, 3), latency=waited)
+            if on_token:
+                on_token(text)
+        return text, words, round(time.time() - start_time, 2), ttft, winner
+
+class _ObservedMetrics:
+    """Forwards records to a ``MetricsRecorder`` (if any) and feeds them to a ``HedgePolicy``'s history."""
+
+    def __init__(self, policy: HedgePolicy, metrics):
+        self.policy = policy
+        self.metrics = metrics
+
+    def record(self, **fields):
+        self.policy.observe(**fields)
+        if self.metrics:
+            self.metrics.record(**fields)
+
+def _ignore(piece):
+    pass
 
 class AIModel:
     def __init__(self, model_name: str):
         self.model_name = model_name
-        self.is_openai = model_name.startswith("gpt-")
+        self.backend = backend_for(model_name)
+        self.is_openai = self.backend == "openai"
+        self.client = get_client(model_name)
+        self.keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", DEFAULT_KEEP_ALIVE)
+        self.num_ctx = int(os.getenv("OLLAMA_NUM_CTX", DEFAULT_NUM_CTX)) if self.backend == "ollama" else None
         if self.is_openai:
-            self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        print(f"[Model] Using model: {model_name} ({'OpenAI' if self.is_openai else 'Ollama'})")
-
-    def generate(self, prompt: str, min_words=1000, max_tokens=3072, tail_words=300):
-        start_time = time.time()
-
-        if prompt.strip().endswith("### CONTINUE"):
-            body = prompt.replace("### CONTINUE", "").strip()
-            context = self._get_tail(body, tail_words)
-            full_prompt = (
-                f"The current story is continuing. Recent context:\n\n"
-                f"{context}\n\n"
-                "Continue writing the next section of the chapter, keeping style, tone, and narrative flow consistent."
-            )
+            self.options = {"temperature": 0.9}
+        elif self.num_ctx:
+            self.options = {"num_ctx": self.num_ctx}
         else:
-            full_prompt = (
-                "You are an expert fiction author. Write the beginning of a novel chapter in a compelling, immersive style.\n\n"
-                f"{prompt}"
-            )
+            self.options = {}
+        print(f"[Model] Using model: {model_name} ({get_backend(self.backend).label})")
 
+    def warm(self):
+        """Load the model ahead of the first request (an empty Ollama prompt loads the weights and keeps them resident)."""
+        if self.backend != "ollama":
+            return
         try:
-            if self.is_openai:
-                response = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "system", "content": "You are a fiction-writing assistant."},
-                        {"role": "user", "content": full_prompt}
-                    ],
-                    max_tokens=max_tokens,
-                    temperature=0.9
-                )
-                text = response.choices[0].message.content.strip()
-                usage = response.usage
-                prompt_tokens = usage.prompt_tokens
-                completion_tokens = usage.completion_tokens
-                total_tokens = usage.total_tokens
-
-                print(f"[OpenAI Usage] Prompt: {prompt_tokens}, Completion: {completion_tokens}, Total: {total_tokens}")
-                with open("openai_usage.log", "a", encoding="utf-8") as log:
-                    log.write(f"{time.ctime()} - {self.model_name} - Prompt: {prompt_tokens}, Completion: {completion_tokens}, Total: {total_tokens}\n")
+            self.client.generate(model=self.model_name, prompt="", keep_alive=self.keep_alive)
+            print(f"[Model] Warmed {self.model_name}")
+        except Exception as e:
+            print(f"[Warning] Could not warm {self.model_name}: {e}")
+
+    def generate(self, prompt: str, min_words=1000, max_tokens=3072, tail_words=300, on_token=None, cache=None, metrics=None, session=None,
+                 max_continuations=MAX_CONTINUATIONS):
+        """Generate text for ``prompt``.
 
+        When ``on_token`` is given the backend is streamed and the callback
+        receives each text fragment as it arrives. With a ``ResponseCache``
+        an identical earlier request is answered from disk, and with a
+        ``MetricsRecorder`` every call (including failures) is recorded.
+        Backend calls go through the backend's ``BackendScheduler``, which
+        rate-limits them and retries transient failures.
+
+        On backends that return their KV context (Ollama), output shorter than
+        ``min_words`` is continued from that context for up to
+        ``max_continuations`` more calls (pass 0 for structured output), and a ``Session`` carries the context
+        on to the next call (e.g. the next page of a chapter) so the model
+        does not re-prefill text it has already seen. Returns
+        ``(text, word_count, elapsed, ttft)``; ``ttft`` (time to first token)
+        is ``None`` for non-streaming calls. Context that would not leave room
+        for the prompt and ``max_tokens`` in the model's ``num_ctx`` window is
+        dropped rather than left for Ollama to truncate. A cached reply
+        restores the context that was stored with it, so replays keep hitting
+        the cache page after page.
+        """
+        start_time = time.time()
+        if self.backend not in CONTEXT_BACKENDS:
+            session = None
+        elif session is None:
+            session = Session()
 
+        continuing = prompt.strip().endswith("### CONTINUE")
+        if session and session.context and not self._fits(session, CONTINUE_PROMPT if continuing else STORY_WRAPPER + prompt, max_tokens):
+            print(f"[Context] Dropping {len(session.context)} tokens of session context to fit num_ctx {self.num_ctx}")
+            session.reset()
+
+        if continuing:
+            if session and session.context:
+                full_prompt = CONTINUE_PROMPT
             else:
-                response = ollama.generate(
-                    model=self.model_name,
-                    prompt=full_prompt,
-                    stream=False,
-                    options={"num_predict": max_tokens}
-                )
-                text = response.get("response", "").strip()
-        except Exception as e:
-            raise RuntimeError(f"[Model Error] Generation failed: {e}")
+                body = prompt.replace("### CONTINUE", "").strip()
+                tail = self._get_tail(body, tail_words)
+                full_prompt = f"The current story is continuing. Recent context:\n\n{tail}\n\n{CONTINUE_PROMPT}"
+        else:
+            full_prompt = STORY_WRAPPER + prompt
+
+        options = {**self.options, "context": session.digest()} if session and session.context else self.options
+        key = cache.make_key(self.model_name, full_prompt, max_tokens, options) if cache else None
+        cached = cache.get_entry(key) if cache else None
+        if cached is not None:
+            text, first_token_at = cached["text"], None
+            if on_token:
+                first_token_at = time.time()
+                on_token(text)
+            if session:
+                # Pick up the context the original call ended with, so the next page's key matches too.
+                session.update(cached.get("context"))
+            if metrics:
+                self._record(metrics, "cache_hit", start_time, first_token_at, full_prompt, text, {})
+        else:
+            text, usage, first_token_at = self._run(full_prompt, max_tokens, on_token, session.context if session else None, metrics)
+            if session:
+                session.update(usage.get("context"))
+            continuations = 0
+            while (session and session.context and len(text.split()) < min_words and continuations < max_continuations
+                   and self._fits(session, CONTINUE_PROMPT, max_tokens)):
+                continuations += 1
+                print(f"[Continue] {len(text.split())} words so far; continuing from retained context ({continuations}/{max_continuations})")
+                if on_token:
+                    on_token("\n\n")
+                try:
+                    more, usage, _ = self._run(CONTINUE_PROMPT, max_tokens, on_token, session.context, metrics)
+                except RuntimeError as e:
+                    print(f"[Warning] Continuation failed: {e}")
+                    session.reset()
+                    break
+                session.update(usage.get("context"))
+                if not more:
+                    break
+                text = f"{text}\n\n{more}"
+            if cache and text:
+                cache.put(key, text, model=self.model_name, context=session.context if session else None)
 
         elapsed = round(time.time() - start_time, 2)
+        ttft = round(first_token_at - start_time, 2) if first_token_at else None
         word_count = len(text.split())
 
         if word_count < min_words:
             print(f"[Warning] Only {word_count} words generated (target was {min_words})")
 
-        return text, word_count, elapsed
+        return text, word_count, elapsed, ttft
+
+    def _fits(self, session: Session, full_prompt: str, max_tokens: int) -> bool:
+        """Whether ``session``'s context, ``full_prompt`` and ``max_tokens`` of output fit in the model's window."""
+        return not self.num_ctx or len(session.context) + count_tokens(full_prompt, self.model_name) + max_tokens <= self.num_ctx
+
+    def _run(self, full_prompt: str, max_tokens: int, on_token, context, metrics):
+        """One scheduled backend call; returns ``(text, usage, first_token_at)`` or raises ``RuntimeError``."""
+        start_time = time.time()
+        first_token_at = None
+        usage = {}
+        attempts = 0
+
+        def call_backend():
+            nonlocal first_token_at, attempts
+            attempts += 1
+            usage.clear()
+            if on_token is None:
+                return getattr(self, f"_generate_{self.backend}", self._generate_client)(full_prompt, max_tokens, usage, context)
+            pieces = []
+            for piece in getattr(self, f"_stream_{self.backend}", self._stream_client)(full_prompt, max_tokens, usage, context):
+                if not piece:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.time()
+                pieces.append(piece)
+                on_token(piece)
+            return "".join(pieces).strip()
+
+        scheduler = get_scheduler(self.backend)
+        estimated = count_tokens(SYSTEM_PROMPT + full_prompt, self.model_name) + max_tokens
+        try:
+            # A stream that has already emitted text can't be retried without duplicating it.
+            text, _ = scheduler.run(call_backend, estimated, can_retry=lambda: first_token_at is None)
+        except HedgeCancelled as e:
+            if metrics:
+                self._record(metrics, "cancelled", start_time, first_token_at, full_prompt, "", usage, attempts=attempts, error=str(e))
+            raise
+        except Exception as e:
+            if metrics:
+                self._record(metrics, "error", start_time, first_token_at, full_prompt, "", usage, attempts=attempts, error=str(e))
+            raise RuntimeError(f"[Model Error] Generation failed: {e}")
+
+        if "prompt_tokens" in usage:
+            scheduler.settle_tokens(estimated, usage["prompt_tokens"] + usage.get("completion_tokens", 0))
+        if metrics:
+            self._record(metrics, "ok", start_time, first_token_at, full_prompt, text, usage, attempts=attempts)
+        return text, usage, first_token_at
+
+    def _record(self, metrics, outcome: str, start_time: float, first_token_at, full_prompt: str, text: str, usage: dict, **extra):
+        latency = time.time() - start_time
+        prompt_tokens = usage.get("prompt_tokens") or count_tokens(SYSTEM_PROMPT + full_prompt, self.model_name)
+        completion_tokens = usage.get("completion_tokens") if "completion_tokens" in usage else count_tokens(text, self.model_name)
+        generation_time = latency - (first_token_at - start_time) if first_token_at else latency
+        metrics.record(
+            model=self.model_name,
+            backend=self.backend,
+            outcome=outcome,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            ttft=round(first_token_at - start_time, 3) if first_token_at else None,
+            latency=round(latency, 3),
+            tokens_per_sec=round(completion_tokens / generation_time, 2) if completion_tokens and generation_time > 0 else None,
+            cached_tokens=usage.get("cached_tokens"),
+            estimated_tokens="prompt_tokens" not in usage,
+            **extra
+        )
+
+    def _openai_messages(self, full_prompt: str):
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": full_prompt}
+        ]
+
+    def _openai_usage(self, response_usage, usage: dict):
+        usage["prompt_tokens"] = response_usage.prompt_tokens
+        usage["completion_tokens"] = response_usage.completion_tokens
+        details = getattr(response_usage, "prompt_tokens_details", None)
+        if getattr(details, "cached_tokens", None) is not None:
+            usage["cached_tokens"] = details.cached_tokens
+
+    def _generate_openai(self, full_prompt: str, max_tokens: int, usage: dict, context=None) -> str:
+        response = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=self._openai_messages(full_prompt),
+            max_tokens=max_tokens,
+            **self.options
+        )
+        self._openai_usage(response.usage, usage)
+        return response.choices[0].message.content.strip()
+
+    def _stream_openai(self, full_prompt: str, max_tokens: int, usage: dict, context=None):
+        response = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=self._openai_messages(full_prompt),
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+            **self.options
+        )
+        for chunk in response:
+            if chunk.choices:
+                yield chunk.choices[0].delta.content or ""
+            if getattr(chunk, "usage", None):
+                self._openai_usage(chunk.usage, usage)
+
+    def _ollama_usage(self, response, usage: dict):
+        if response.get("prompt_eval_count") is not None:
+            usage["prompt_tokens"] = response.get("prompt_eval_count")
+            usage["completion_tokens"] = response.get("eval_count") or 0
+        if response.get("context"):
+            usage["context"] = response.get("context")
+
+    def _generate_ollama(self, full_prompt: str, max_tokens: int, usage: dict, context=None) -> str:
+        response = self.client.generate(
+            model=self.model_name,
+            prompt=full_prompt,
+            context=context,
+            stream=False,
+            options={"num_predict": max_tokens, **self.options},
+            keep_alive=self.keep_alive
+        )
+        self._ollama_usage(response, usage)
+        return response.get("response", "").strip()
+
+    def _stream_ollama(self, full_prompt: str, max_tokens: int, usage: dict, context=None):
+        for chunk in self.client.generate(
+            model=self.model_name,
+            prompt=full_prompt,
+            context=context,
+            stream=True,
+            options={"num_predict": max_tokens, **self.options},
+            keep_alive=self.keep_alive
+        ):
+            if chunk.get("done"):
+                self._ollama_usage(chunk, usage)
+            yield chunk.get("response", "")
+
+    def _fake_usage(self, full_prompt: str, usage: dict):
+        usage["cached_tokens"] = self.client.cached_tokens(full_prompt)
+
+    def _generate_fake(self, full_prompt: str, max_tokens: int, usage: dict, context=None) -> str:
+        self._fake_usage(full_prompt, usage)
+        return self.client.generate(full_prompt, max_tokens)
+
+    def _stream_fake(self, full_prompt: str, max_tokens: int, usage: dict, context=None):
+        self._fake_usage(full_prompt, usage)
+        return self.client.stream(full_prompt, max_tokens)
+
+    def _generate_hf(self, full_prompt: str, max_tokens: int, usage: dict, context=None) -> str:
+        text, usage["prompt_tokens"], usage["completion_tokens"] = self.client.generate(self.client.format(SYSTEM_PROMPT, full_prompt), max_tokens)
+        return text
+
+    def _stream_hf(self, full_prompt: str, max_tokens: int, usage: dict, context=None):
+        return self.client.stream(self.client.format(SYSTEM_PROMPT, full_prompt), max_tokens, usage)
+
+    # Registered backends without their own methods above: the client takes a prompt and a token budget.
+    def _generate_client(self, full_prompt: str, max_tokens: int, usage: dict, context=None) -> str:
+        return self.client.generate(full_prompt, max_tokens)
+
+    def _stream_client(self, full_prompt: str, max_tokens: int, usage: dict, context=None):
+        return self.client.stream(full_prompt, max_tokens)
 
     def _get_tail(self, text, word_limit):
         words = text.split()
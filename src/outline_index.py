@@ -0,0 +1,167 @@
+import hashlib
+import json
+import re
+import threading
+from pathlib import Path
+
+INDEX_NAME = "outline_index.json"
+INDEX_VERSION = 2
+
+CHAPTER_HEADING = re.compile(r"^[ \t#*]*chapter\s+(\d+)\b[ \t*]*[:.\-–—]?[ \t]*(.*?)[ \t*]*$", re.IGNORECASE | re.MULTILINE)
+SECTION_HEADING = re.compile(r"^[ \t#*]*(?:characters|setting|central theme|theme|key scenes)\b[^\n]*$", re.IGNORECASE | re.MULTILINE)
+LABELLED_LINE = re.compile(r"^[ \t\-*•]*(title|summary|intro|introduction|conflict|climax)[ \t*]*:[ \t*]*(.*)$", re.IGNORECASE)
+STRUCTURE_KEYS = {"intro": "intro", "introduction": "intro", "conflict": "conflict", "climax": "climax"}
+
+_memo = {}
+_lock = threading.Lock()
+
+def _outline_paths(project_path: Path):
+    chapters = project_path / "chapters"
+    return chapters / "outline_raw.txt", chapters / "outline.json", chapters / INDEX_NAME
+
+def _stat_signature(path: Path):
+    if not path.exists():
+        return None
+    st = path.stat()
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+def _hash(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+def _source_matches(path: Path, recorded) -> bool:
+    """Cheap mtime/size check first; fall back to the content hash when only the mtime moved."""
+    current = _stat_signature(path)
+    if current is None or recorded is None:
+        return current is None and recorded is None
+    if current["mtime_ns"] == recorded["mtime_ns"] and current["size"] == recorded["size"]:
+        return True
+    if current["size"] == recorded["size"] and _hash(path) == recorded.get("sha256"):
+        recorded["mtime_ns"] = current["mtime_ns"]
+        return True
+    return False
+
+def _signature(path: Path):
+    sig = _stat_signature(path)
+    if sig is not None:
+        sig["sha256"] = _hash(path)
+    return sig
+
+def parse_raw_outline(text: str) -> dict:
+    """Split a prose outline into ``{chapter_number: entry}`` using its chapter headings."""
+    headings = list(CHAPTER_HEADING.finditer(text))
+    chapters = {}
+    for i, match in enumerate(headings):
+        end = headings[i + 1].start() if i + 1 < len(headings) else len(text)
+        block = text[match.end():end]
+        section = SECTION_HEADING.search(block)
+        if section:
+            block = block[:section.start()]
+
+        title = match.group(2).strip(" \"'*")
+        summary_lines, structure, labelled_summary = [], {}, ""
+        for line in block.strip().splitlines():
+            label = LABELLED_LINE.match(line)
+            if label:
+                key, value = label.group(1).lower(), label.group(2).strip()
+                if key == "title" and not title:
+                    title = value.strip("\"'")
+                    continue
+                if key == "summary":
+                    labelled_summary = value
+                elif key in STRUCTURE_KEYS:
+                    structure[STRUCTURE_KEYS[key]] = value
+            summary_lines.append(line)
+
+        number = int(match.group(1))
+        if number not in chapters:
+            chapters[number] = {
+                "title": title,
+                "summary": "\n".join(summary_lines).strip() or labelled_summary,
+                "structure": structure,
+            }
+    return chapters
+
+def _mentioned_characters(entry: dict, names: list) -> list:
+    haystack = " ".join([entry.get("title", ""), entry.get("summary", "")] + list(entry.get("structure", {}).values())).lower()
+    found = []
+    for name in names:
+        if not name:
+            continue
+        first = name.split()[0].lower()
+        if name.lower() in haystack or re.search(rf"\b{re.escape(first)}\b", haystack):
+            found.append(name)
+    return found
+
+def build_outline_index(raw_path: Path, json_path: Path) -> dict:
+    raw_chapters = parse_raw_outline(raw_path.read_text(encoding="utf-8")) if raw_path.exists() else {}
+
+    outline = {}
+    if json_path.exists():
+        try:
+            outline = json.loads(json_path.read_text(encoding="utf-8"))
+        except ValueError:
+            outline = {}
+    json_chapters = {i + 1: ch for i, ch in enumerate(outline.get("chapters", [])) if isinstance(ch, dict)}
+    characters = [c for c in outline.get("characters", []) if isinstance(c, dict)]
+    names = [c.get("name", "") for c in characters]
+
+    chapters = {}
+    for number in sorted(set(raw_chapters) | set(json_chapters)):
+        raw, structured = raw_chapters.get(number, {}), json_chapters.get(number, {})
+        entry = {
+            "title": raw.get("title") or structured.get("title", ""),
+            "summary": raw.get("summary") or structured.get("summary", ""),
+            "structure": raw.get("structure") or structured.get("structure", {}),
+            "key_scenes": structured.get("key_scenes", []),
+        }
+        entry["characters"] = _mentioned_characters(entry, names)
+        chapters[str(number)] = entry
+
+    return {
+        "version": INDEX_VERSION,
+        "sources": {"outline_raw.txt": _signature(raw_path), "outline.json": _signature(json_path)},
+        "characters": characters,
+        "setting": outline.get("setting", ""),
+        "theme": outline.get("theme", ""),
+        "key_scenes": outline.get("key_scenes", []),
+        "chapters": chapters,
+    }
+
+def _is_current(index: dict, raw_path: Path, json_path: Path) -> bool:
+    sources = index.get("sources", {})
+    return (index.get("version") == INDEX_VERSION
+            and _source_matches(raw_path, sources.get("outline_raw.txt"))
+            and _source_matches(json_path, sources.get("outline.json")))
+
+def load_outline_index(project_path: Path, persist: bool = True) -> dict:
+    """Return the project's outline index, rebuilding it only when an outline file changed.
+
+    The index is kept in memory for the life of the process and, unless
+    ``persist`` is off (dry runs), saved as ``chapters/outline_index.json``
+    next to the outlines it was built from.
+    """
+    raw_path, json_path, index_path = _outline_paths(project_path)
+    with _lock:
+        index = _memo.get(index_path)
+        if index is not None and _is_current(index, raw_path, json_path):
+            return index
+
+        index = None
+        if index_path.exists():
+            try:
+                index = json.loads(index_path.read_text(encoding="utf-8"))
+            except ValueError:
+                index = None
+        if index is None or not _is_current(index, raw_path, json_path):
+            index = build_outline_index(raw_path, json_path)
+            if not persist:
+                # Not remembered either, so the next real run still saves it.
+                return index
+            if raw_path.exists() or json_path.exists():
+                index_path.write_text(json.dumps(index, indent=4), encoding="utf-8")
+
+        _memo[index_path] = index
+        return index
+
+def get_chapter_entry(project_path: Path, chapter_number: int) -> dict:
+    return load_outline_index(project_path)["chapters"].get(str(chapter_number), {})
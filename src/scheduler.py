@@ -0,0 +1,172 @@
+import random
+import threading
+import time
+
+# Per-backend defaults; override per project with "rate_limits" in project.json.
+DEFAULT_LIMITS = {
+    "openai": {"rpm": 500, "tpm": 90000, "min_concurrency": 1, "max_concurrency": 8},
+    "ollama": {"rpm": None, "tpm": None, "min_concurrency": 1, "max_concurrency": 2},
+    "fake": {"rpm": None, "tpm": None, "min_concurrency": 1, "max_concurrency": 16},
+    # In-process models: admit a full batch at once so concurrent calls can be padded into one generate.
+    "hf": {"rpm": None, "tpm": None, "min_concurrency": 8, "max_concurrency": 8},
+}
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+THROTTLE_STATUS = {429, 503}
+
+_schedulers = {}
+_lock = threading.Lock()
+
+class TokenBucket:
+    """Refills at ``per_minute`` units per minute up to one minute's worth of burst."""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1):
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                wait = (amount - self.level) / self.rate
+            time.sleep(min(wait, 5.0))
+
+    def settle(self, delta: float):
+        """Charge (or refund, if negative) the difference between estimated and actual usage."""
+        with self._lock:
+            self._refill()
+            self.level = min(self.capacity, self.level - delta)
+
+def classify_error(error: Exception):
+    """Return ``(retryable, throttled, retry_after_seconds)`` for a backend exception.
+
+    Works from duck-typed attributes (``status_code``, ``response.headers``,
+    ``retryable``) so no backend SDK has to be imported here.
+    """
+    status = getattr(error, "status_code", None)
+    retry_after = None
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers:
+        try:
+            if headers.get("retry-after-ms"):
+                retry_after = float(headers["retry-after-ms"]) / 1000
+            elif headers.get("retry-after"):
+                retry_after = float(headers["retry-after"])
+        except (TypeError, ValueError):
+            retry_after = None
+
+    if getattr(error, "retryable", False):
+        return True, bool(getattr(error, "throttled", False)), retry_after
+    if status is not None:
+        return status in RETRYABLE_STATUS, status in THROTTLE_STATUS, retry_after
+    name = type(error).__name__
+    transient = isinstance(error, (TimeoutError, ConnectionError)) or "Timeout" in name or "Connection" in name
+    return transient, False, retry_after
+
+class BackendScheduler:
+    """Admission control for one backend: rate limits, retries and adaptive concurrency.
+
+    Requests wait for a concurrency slot and for request/token budget from the
+    token buckets. Retryable failures back off exponentially with full jitter
+    (or for ``Retry-After`` when the server sends it). The concurrency limit
+    follows AIMD: each success adds ``1/limit``; each throttle halves it and
+    pauses the whole backend until the throttle window has passed.
+    """
+
+    def __init__(self, name: str, rpm=None, tpm=None, min_concurrency: int = 1, max_concurrency: int = 4):
+        self.name = name
+        self.settings = {"rpm": rpm, "tpm": tpm, "min_concurrency": min_concurrency, "max_concurrency": max_concurrency}
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.limit = float(max(self.min_concurrency, min(2, self.max_concurrency)))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def _acquire_slot(self):
+        with self._cond:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self._cond.wait(timeout=pause if pause > 0 else None)
+
+    def _release_slot(self, throttled: bool = False, succeeded: bool = False, retry_after: float = None):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                if retry_after:
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            elif succeeded:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def run(self, fn, est_tokens: int = 0, can_retry=None, max_retries: int = MAX_RETRIES):
+        """Call ``fn()`` under this backend's limits; returns ``(result, attempts)``.
+
+        ``can_retry`` is consulted before each retry (e.g. to refuse once a
+        stream has already emitted text).
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            self._acquire_slot()
+            if self.requests:
+                self.requests.acquire(1)
+            if self.tokens and est_tokens:
+                self.tokens.acquire(est_tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                retryable, throttled, retry_after = classify_error(e)
+                self._release_slot(throttled=throttled, retry_after=retry_after)
+                if not retryable or attempt > max_retries or (can_retry and not can_retry()):
+                    raise
+                delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempt - 1)))
+                if retry_after:
+                    delay = max(delay, retry_after)
+                print(f"[Retry] {self.name} attempt {attempt} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            self._release_slot(succeeded=True)
+            return result, attempt
+
+    def settle_tokens(self, estimated: int, actual: int):
+        """Correct the token bucket once the backend reports real usage."""
+        if self.tokens and actual is not None:
+            self.tokens.settle(actual - estimated)
+
+def configure_schedulers(overrides: dict = None):
+    """Apply per-backend limits (``{"openai": {"rpm": ..., "tpm": ..., "max_concurrency": ...}}``)."""
+    for backend, limits in (overrides or {}).items():
+        settings = {**DEFAULT_LIMITS.get(backend, {}), **limits}
+        with _lock:
+            current = _schedulers.get(backend)
+            # Keep the live scheduler (and its learned limit) when nothing changed.
+            if current is None or current.settings != settings:
+                _schedulers[backend] = BackendScheduler(backend, **settings)
+
+def get_scheduler(backend: str) -> BackendScheduler:
+    with _lock:
+        if backend not in _schedulers:
+            _schedulers[backend] = BackendScheduler(backend, **DEFAULT_LIMITS.get(backend, {}))
+        return _schedulers[backend]
@@ -0,0 +1,452 @@
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+DB_NAME = "plotforge.db"
+RUNS_FILE = "runs.jsonl"
+
+PAGE_FILE = re.compile(r"^page_(\d+)_(draft|approved|summary)(?:_(.+?))?\.(md|txt)$")
+CHAPTER_FILE = re.compile(r"^chapter_(\d+)_(approved|final|summary)\.(md|txt)$")
+
+class FileStore:
+    """The original one-file-per-artifact project layout.
+
+    Drafts and approvals live in ``chapters/chapter_N/``, page summaries in
+    ``summaries/``, and model runs are appended to ``runs.jsonl``.
+    """
+
+    def __init__(self, project_path: Path):
+        self.project_path = project_path
+        self.summaries_path = project_path / "summaries"
+        self._lock = threading.Lock()
+
+    def _chapter_path(self, chapter: int) -> Path:
+        # Reads resolve paths without creating anything, so a dry run leaves the project untouched.
+        return self.project_path / "chapters" / f"chapter_{chapter}"
+
+    def chapter_dir(self, chapter: int) -> Path:
+        chapter_dir = self._chapter_path(chapter)
+        chapter_dir.mkdir(parents=True, exist_ok=True)
+        return chapter_dir
+
+    @contextmanager
+    def batch(self):
+        yield self
+
+    def read_summary(self, page: int) -> str:
+        file = self.summaries_path / f"page_{page}_summary.txt"
+        return file.read_text(encoding="utf-8") if file.exists() else ""
+
+    def write_summary(self, page: int, text: str):
+        self.summaries_path.mkdir(exist_ok=True)
+        (self.summaries_path / f"page_{page}_summary.txt").write_text(text, encoding="utf-8")
+
+    def read_draft(self, chapter: int, page: int, variant: str = ""):
+        file = self._chapter_path(chapter) / f"page_{page}_draft{variant}.md"
+        return file.read_text(encoding="utf-8") if file.exists() else None
+
+    def write_draft(self, chapter: int, page: int, text: str, variant: str = "") -> str:
+        path = self.chapter_dir(chapter) / f"page_{page}_draft{variant}.md"
+        path.write_text(text, encoding="utf-8")
+        return str(path)
+
+    def record_run(self, page: int, model: str, words: int, duration: float):
+        line = json.dumps({"page": page, "model": model, "words": words, "duration": duration, "created_at": time.time()})
+        with self._lock, open(self.project_path / RUNS_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def runs(self) -> list:
+        """Every recorded run as ``(page, model, words, duration, created_at)``, oldest first."""
+        path = self.project_path / RUNS_FILE
+        if not path.exists():
+            return []
+        rows = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    run = json.loads(line)
+                except ValueError:
+                    continue
+                rows.append((run["page"], run["model"], run["words"], run["duration"], run["created_at"]))
+        return rows
+
+    def approve_pages(self, chapter: int, pages) -> list:
+        chapter_dir = self.chapter_dir(chapter)
+        approved = []
+        for page in pages:
+            if (chapter_dir / f"page_{page}_draft.md").exists():
+                (chapter_dir / f"page_{page}_approved.txt").write_text("auto-approved", encoding="utf-8")
+                approved.append(page)
+        (chapter_dir / f"chapter_{chapter}_approved.txt").write_text("approved", encoding="utf-8")
+        return approved
+
+    def chapter_pages(self, chapter: int, pages):
+        """Yield ``(page, draft_text_or_None, approved)`` for each page in order."""
+        chapter_dir = self._chapter_path(chapter)
+        for page in pages:
+            draft = chapter_dir / f"page_{page}_draft.md"
+            text = draft.read_text(encoding="utf-8") if draft.exists() else None
+            yield page, text, (chapter_dir / f"page_{page}_approved.txt").exists()
+
+    def list_pages(self):
+        """Return ``(chapter, page, words, approved, has_summary)`` rows for every main draft."""
+        rows = []
+        for draft in self.project_path.glob("chapters/chapter_*/page_*_draft.md"):
+            page = int(PAGE_FILE.match(draft.name).group(1))
+            chapter = int(draft.parent.name.split("_")[1])
+            words = len(draft.read_text(encoding="utf-8").split())
+            approved = (draft.parent / f"page_{page}_approved.txt").exists()
+            has_summary = (self.summaries_path / f"page_{page}_summary.txt").exists()
+            rows.append((chapter, page, words, approved, has_summary))
+        return sorted(rows, key=lambda r: r[1])
+
+    def chapter_numbers(self) -> list:
+        return sorted(int(d.name.split("_")[1]) for d in self.project_path.glob("chapters/chapter_*") if d.is_dir())
+
+    def read_chapter_final(self, chapter: int):
+        path = self._chapter_path(chapter) / f"chapter_{chapter}_final.md"
+        return path.read_text(encoding="utf-8") if path.exists() else None
+
+    def open_chapter_final(self, chapter: int):
+        return open(self._chapter_path(chapter) / f"chapter_{chapter}_final.md", encoding="utf-8")
+
+    def write_chapter_final(self, chapter: int, pieces) -> str:
+        """Stream ``pieces`` into ``chapter_N_final.md`` via a temp file, never joining them in memory."""
+        path = self.chapter_dir(chapter) / f"chapter_{chapter}_final.md"
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as out:
+            for piece in pieces:
+                out.write(piece)
+        os.replace(tmp, path)
+        return str(path)
+
+    def final_is_current(self, chapter: int, pages) -> bool:
+        """True when ``chapter_N_final.md`` is newer than every draft and approval it was built from."""
+        chapter_dir = self._chapter_path(chapter)
+        final = chapter_dir / f"chapter_{chapter}_final.md"
+        if not final.exists() or final.stat().st_size == 0:
+            return False
+        built = final.stat().st_mtime_ns
+        for page in pages:
+            for name in (f"page_{page}_draft.md", f"page_{page}_approved.txt"):
+                source = chapter_dir / name
+                if source.exists() and source.stat().st_mtime_ns > built:
+                    return False
+        return True
+
+    def read_chapter_summary(self, chapter: int):
+        path = self._chapter_path(chapter) / f"chapter_{chapter}_summary.txt"
+        return path.read_text(encoding="utf-8") if path.exists() else None
+
+    def write_chapter_summary(self, chapter: int, text: str) -> str:
+        path = self.chapter_dir(chapter) / f"chapter_{chapter}_summary.txt"
+        path.write_text(text, encoding="utf-8")
+        return str(path)
+
+    def close(self):
+        pass
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS drafts (
+    page INTEGER NOT NULL,
+    variant TEXT NOT NULL DEFAULT '',
+    chapter INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (page, variant)
+);
+CREATE INDEX IF NOT EXISTS drafts_by_chapter ON drafts (chapter, page);
+CREATE TABLE IF NOT EXISTS summaries (
+    page INTEGER PRIMARY KEY,
+    text TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS approvals (
+    page INTEGER PRIMARY KEY,
+    chapter INTEGER NOT NULL,
+    note TEXT NOT NULL,
+    approved_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS approvals_by_chapter ON approvals (chapter, page);
+CREATE TABLE IF NOT EXISTS chapters (
+    chapter INTEGER PRIMARY KEY,
+    approved INTEGER NOT NULL DEFAULT 0,
+    final TEXT,
+    summary TEXT,
+    updated_at REAL NOT NULL,
+    final_updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS model_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    page INTEGER,
+    model TEXT NOT NULL,
+    words INTEGER,
+    duration REAL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS model_runs_by_page ON model_runs (page);
+"""
+
+class SQLiteStore:
+    """Project storage in a single ``plotforge.db`` with indexed tables.
+
+    One connection is shared across threads behind a lock. Writes commit
+    immediately unless they run inside ``batch()``, which groups them into a
+    single transaction.
+    """
+
+    def __init__(self, project_path: Path):
+        self.project_path = project_path
+        self.db_path = project_path / DB_NAME
+        self._lock = threading.RLock()
+        self._depth = 0
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        if "final_updated_at" not in {row[1] for row in self.conn.execute("PRAGMA table_info(chapters)")}:
+            # Databases created before finals had their own timestamp; updated_at is the best guess for them.
+            self.conn.execute("ALTER TABLE chapters ADD COLUMN final_updated_at REAL")
+            self.conn.execute("UPDATE chapters SET final_updated_at = updated_at WHERE final IS NOT NULL")
+
+    def chapter_dir(self, chapter: int) -> Path:
+        chapter_dir = self.project_path / "chapters" / f"chapter_{chapter}"
+        chapter_dir.mkdir(parents=True, exist_ok=True)
+        return chapter_dir
+
+    @contextmanager
+    def batch(self):
+        with self._lock:
+            if self._depth == 0:
+                self.conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.conn.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self.conn.execute("COMMIT")
+
+    def _write(self, sql: str, params=()):
+        with self.batch():
+            return self.conn.execute(sql, params)
+
+    def _read(self, sql: str, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def read_summary(self, page: int) -> str:
+        rows = self._read("SELECT text FROM summaries WHERE page = ?", (page,))
+        return rows[0][0] if rows else ""
+
+    def write_summary(self, page: int, text: str, updated_at: float = None):
+        self._write("INSERT OR REPLACE INTO summaries (page, text, updated_at) VALUES (?, ?, ?)", (page, text, updated_at or time.time()))
+
+    def read_draft(self, chapter: int, page: int, variant: str = ""):
+        rows = self._read("SELECT text FROM drafts WHERE page = ? AND variant = ?", (page, variant))
+        return rows[0][0] if rows else None
+
+    def write_draft(self, chapter: int, page: int, text: str, variant: str = "", updated_at: float = None) -> str:
+        self._write(
+            "INSERT OR REPLACE INTO drafts (page, variant, chapter, text, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (page, variant, chapter, text, updated_at or time.time())
+        )
+        return f"{DB_NAME}:drafts/{page}{variant}"
+
+    def record_run(self, page: int, model: str, words: int, duration: float):
+        self._write(
+            "INSERT INTO model_runs (page, model, words, duration, created_at) VALUES (?, ?, ?, ?, ?)",
+            (page, model, words, duration, time.time())
+        )
+
+    def approve_pages(self, chapter: int, pages) -> list:
+        pages = list(pages)
+        now = time.time()
+        with self.batch():
+            self.conn.execute(
+                "INSERT OR REPLACE INTO approvals (page, chapter, note, approved_at) "
+                "SELECT page, chapter, 'auto-approved', ? FROM drafts "
+                "WHERE chapter = ? AND variant = '' AND page BETWEEN ? AND ?",
+                (now, chapter, min(pages), max(pages))
+            )
+            self.conn.execute(
+                "INSERT INTO chapters (chapter, approved, updated_at) VALUES (?, 1, ?) "
+                "ON CONFLICT(chapter) DO UPDATE SET approved = 1, updated_at = excluded.updated_at",
+                (chapter, now)
+            )
+            rows = self.conn.execute(
+                "SELECT page FROM approvals WHERE chapter = ? AND page BETWEEN ? AND ? ORDER BY page",
+                (chapter, min(pages), max(pages))
+            ).fetchall()
+        return [page for (page,) in rows]
+
+    def chapter_pages(self, chapter: int, pages):
+        """Yield ``(page, draft_text_or_None, approved)`` for each page in order."""
+        pages = list(pages)
+        rows = self._read(
+            "SELECT d.page, d.text, a.page IS NOT NULL FROM drafts d "
+            "LEFT JOIN approvals a ON a.page = d.page "
+            "WHERE d.variant = '' AND d.page BETWEEN ? AND ?",
+            (min(pages), max(pages))
+        )
+        found = {page: (text, bool(approved)) for page, text, approved in rows}
+        for page in pages:
+            text, approved = found.get(page, (None, False))
+            yield page, text, approved
+
+    def list_pages(self):
+        """Return ``(chapter, page, words, approved, has_summary)`` rows for every main draft."""
+        rows = self._read(
+            "SELECT d.chapter, d.page, d.text, a.page IS NOT NULL, s.page IS NOT NULL FROM drafts d "
+            "LEFT JOIN approvals a ON a.page = d.page "
+            "LEFT JOIN summaries s ON s.page = d.page "
+            "WHERE d.variant = '' ORDER BY d.page"
+        )
+        return [(chapter, page, len(text.split()), bool(a), bool(s)) for chapter, page, text, a, s in rows]
+
+    def chapter_numbers(self) -> list:
+        rows = self._read("SELECT chapter FROM chapters UNION SELECT DISTINCT chapter FROM drafts ORDER BY 1")
+        return [chapter for (chapter,) in rows]
+
+    def read_chapter_final(self, chapter: int):
+        rows = self._read("SELECT final FROM chapters WHERE chapter = ?", (chapter,))
+        return rows[0][0] if rows else None
+
+    def open_chapter_final(self, chapter: int):
+        return io.StringIO(self.read_chapter_final(chapter) or "")
+
+    def final_is_current(self, chapter: int, pages) -> bool:
+        pages = list(pages)
+        rows = self._read(
+            "SELECT length(c.final) > 0 AND c.final_updated_at >= MAX("
+            "  COALESCE((SELECT MAX(updated_at) FROM drafts WHERE variant = '' AND page BETWEEN ? AND ?), 0),"
+            "  COALESCE((SELECT MAX(approved_at) FROM approvals WHERE page BETWEEN ? AND ?), 0))"
+            " FROM chapters c WHERE c.chapter = ?",
+            (min(pages), max(pages), min(pages), max(pages), chapter)
+        )
+        return bool(rows and rows[0][0])
+
+    def _set_chapter(self, chapter: int, column: str, value, updated_at: float = None):
+        self._write(
+            f"INSERT INTO chapters (chapter, {column}, updated_at) VALUES (?, ?, ?) "
+            f"ON CONFLICT(chapter) DO UPDATE SET {column} = excluded.{column}, updated_at = MAX(updated_at, excluded.updated_at)",
+            (chapter, value, updated_at or time.time())
+        )
+
+    def write_chapter_final(self, chapter: int, pieces, updated_at: float = None) -> str:
+        # final_updated_at moves only with the final itself; updated_at also moves with the chapter summary.
+        updated_at = updated_at or time.time()
+        text = "".join(pieces)
+        with self.batch():
+            self._set_chapter(chapter, "final", text, updated_at)
+            self._write("UPDATE chapters SET final_updated_at = ? WHERE chapter = ?", (updated_at, chapter))
+        return f"{DB_NAME}:chapters/{chapter}/final"
+
+    def read_chapter_summary(self, chapter: int):
+        rows = self._read("SELECT summary FROM chapters WHERE chapter = ?", (chapter,))
+        return rows[0][0] if rows else None
+
+    def write_chapter_summary(self, chapter: int, text: str) -> str:
+        self._set_chapter(chapter, "summary", text)
+        return f"{DB_NAME}:chapters/{chapter}/summary"
+
+    def set_meta(self, key: str, value):
+        self._write("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+def open_store(project_path: Path, meta: dict):
+    """Return the storage backend selected by ``project.json`` (``"storage": "files" | "sqlite"``)."""
+    if meta.get("storage", "files") == "sqlite":
+        return SQLiteStore(project_path)
+    return FileStore(project_path)
+
+def import_files(project_path: Path, meta: dict) -> dict:
+    """Copy a file-based project into ``plotforge.db`` in one transaction; returns row counts."""
+    db = SQLiteStore(project_path)
+    counts = {"drafts": 0, "approvals": 0, "summaries": 0, "chapters": 0, "runs": 0}
+    try:
+        with db.batch():
+            db.set_meta("project", meta)
+            for chapter_dir in sorted((project_path / "chapters").glob("chapter_*")):
+                if not chapter_dir.is_dir():
+                    continue
+                chapter = int(chapter_dir.name.split("_")[1])
+                for path in chapter_dir.iterdir():
+                    page_match, chapter_match = PAGE_FILE.match(path.name), CHAPTER_FILE.match(path.name)
+                    if page_match and page_match.group(2) == "draft":
+                        variant = f"_{page_match.group(3)}" if page_match.group(3) else ""
+                        db.write_draft(chapter, int(page_match.group(1)), path.read_text(encoding="utf-8"), variant, path.stat().st_mtime)
+                        counts["drafts"] += 1
+                    elif page_match and page_match.group(2) == "approved":
+                        db.conn.execute(
+                            "INSERT OR REPLACE INTO approvals (page, chapter, note, approved_at) VALUES (?, ?, ?, ?)",
+                            (int(page_match.group(1)), chapter, path.read_text(encoding="utf-8"), path.stat().st_mtime)
+                        )
+                        counts["approvals"] += 1
+                    elif chapter_match:
+                        kind = chapter_match.group(2)
+                        if kind == "final":
+                            db.write_chapter_final(chapter, [path.read_text(encoding="utf-8")], path.stat().st_mtime)
+                        else:
+                            value = 1 if kind == "approved" else path.read_text(encoding="utf-8")
+                            db._set_chapter(chapter, kind, value, path.stat().st_mtime)
+                        counts["chapters"] += 1
+            for path in (project_path / "summaries").glob("page_*_summary.txt"):
+                db.write_summary(int(PAGE_FILE.match(path.name).group(1)), path.read_text(encoding="utf-8"), path.stat().st_mtime)
+                counts["summaries"] += 1
+            # runs.jsonl holds every run exported earlier plus those since, so it replaces the table.
+            runs = FileStore(project_path).runs()
+            db.conn.execute("DELETE FROM model_runs")
+            db.conn.executemany("INSERT INTO model_runs (page, model, words, duration, created_at) VALUES (?, ?, ?, ?, ?)", runs)
+            counts["runs"] = len(runs)
+    finally:
+        db.close()
+    return counts
+
+def export_files(project_path: Path) -> dict:
+    """Write every row of ``plotforge.db`` back out in the file-based layout; returns file counts."""
+    db = SQLiteStore(project_path)
+    files = FileStore(project_path)
+    counts = {"drafts": 0, "approvals": 0, "summaries": 0, "chapters": 0, "runs": 0}
+    try:
+        for page, variant, chapter, text in db._read("SELECT page, variant, chapter, text FROM drafts"):
+            files.write_draft(chapter, page, text, variant)
+            counts["drafts"] += 1
+        for page, chapter, note in db._read("SELECT page, chapter, note FROM approvals"):
+            (files.chapter_dir(chapter) / f"page_{page}_approved.txt").write_text(note, encoding="utf-8")
+            counts["approvals"] += 1
+        for page, text in db._read("SELECT page, text FROM summaries"):
+            files.write_summary(page, text)
+            counts["summaries"] += 1
+        for chapter, approved, final, summary in db._read("SELECT chapter, approved, final, summary FROM chapters"):
+            if approved:
+                (files.chapter_dir(chapter) / f"chapter_{chapter}_approved.txt").write_text("approved", encoding="utf-8")
+            if final is not None:
+                files.write_chapter_final(chapter, [final])
+            if summary is not None:
+                files.write_chapter_summary(chapter, summary)
+            counts["chapters"] += 1
+        runs = db._read("SELECT page, model, words, duration, created_at FROM model_runs ORDER BY id")
+        lines = [json.dumps(dict(zip(("page", "model", "words", "duration", "created_at"), run))) + "\n" for run in runs]
+        (project_path / RUNS_FILE).write_text("".join(lines), encoding="utf-8")
+        counts["runs"] = len(runs)
+    finally:
+        db.close()
+    return counts
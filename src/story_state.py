@@ -0,0 +1,237 @@
+import bisect
+import heapq
+import json
+import math
+import os
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from extractive import ENTITY_PREFIX, MAX_ENTITIES, STOPWORDS, WORD, extract_entities, find_names, split_sentences
+
+STATE_FILE = "story_state.jsonl"
+LEGACY_STATE_FILE = "story_state.json"
+STATE_VERSION = 2
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+TOP_K = 3
+MAX_QUERY_TERMS = 24
+MAX_CHARACTERS = 5
+PASSAGE_WORDS = 60
+STATE_WORDS = 30
+
+_memo = {}
+_lock = threading.Lock()
+
+def index_terms(text: str) -> list:
+    return [w for w in (m.lower() for m in WORD.findall(text or "")) if len(w) > 2 and w not in STOPWORDS]
+
+def _stat_signature(path: Path):
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def _strip_entities(summary: str) -> str:
+    return "\n".join(line for line in summary.splitlines() if not line.startswith(ENTITY_PREFIX)).strip()
+
+class StoryState:
+    """Long-range story memory: a BM25 index over page summaries plus a character table.
+
+    Persisted as the append-only log ``story_state.jsonl``: a version header,
+    then one line per indexed page with its term counts and the state of each
+    character it names. Indexing a page appends one line and updates the
+    inverted index in place, so saving a page costs the same on page 300 as on
+    page 3. A re-indexed page replaces its earlier line when the log is
+    replayed, and the log is compacted on load once superseded lines
+    outnumber live ones. A query only touches the postings of its own
+    (capped) terms, so lookups stay cheap as the book grows.
+
+    Lookups for page N only see pages before N (collection statistics and
+    character history included), so the context for a page does not change
+    when later pages are written and resumed runs build identical prompts.
+    ``since_page`` narrows that window further, e.g. to the current chapter
+    when chapters are written concurrently, and ``extra_pages`` lets pages
+    before ``since_page`` back in (chapters finished before the run began).
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.pages = {}
+        self.characters = defaultdict(list)
+        self.postings = defaultdict(dict)
+        self._order = []
+        self._prefix_lengths = [0]
+        self._lock = threading.Lock()
+        lines = self._load()
+        for page in sorted(self.pages):
+            self._index(page, self.pages[page])
+        self._reorder()
+        if lines is None or lines > 2 * max(1, len(self.pages)):
+            self._compact()
+        self.signature = _stat_signature(self.path)
+
+    def _load(self) -> int:
+        """Replay the log into ``pages``; returns how many page lines it held, or ``None`` if it is unreadable."""
+        if not self.path.exists():
+            legacy = self.path.with_name(LEGACY_STATE_FILE)
+            if legacy.exists():
+                self._import_legacy(legacy)
+                self._compact()
+            return len(self.pages)
+        lines = 0
+        with open(self.path, encoding="utf-8") as f:
+            header = f.readline()
+            try:
+                if json.loads(header).get("version") != STATE_VERSION:
+                    return None
+            except ValueError:
+                return None
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+                lines += 1
+                self.pages[entry.pop("page")] = entry
+        return lines
+
+    def _import_legacy(self, legacy: Path):
+        """Convert a version 1 ``story_state.json`` (whole index rewritten per page)."""
+        try:
+            data = json.loads(legacy.read_text(encoding="utf-8"))
+        except ValueError:
+            return
+        if data.get("version") != 1:
+            return
+        self.pages = {int(page): {**entry, "characters": {}} for page, entry in data.get("pages", {}).items()}
+        for name, history in data.get("characters", {}).items():
+            for page, state in history:
+                if page in self.pages:
+                    self.pages[page]["characters"][name] = state
+
+    def _compact(self):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"version": STATE_VERSION}) + "\n")
+            for page in sorted(self.pages):
+                f.write(json.dumps({"page": page, **self.pages[page]}, separators=(",", ":")) + "\n")
+        os.replace(tmp, self.path)
+
+    def _index(self, page: int, entry: dict):
+        for term, tf in entry["terms"].items():
+            self.postings[term][page] = tf
+        for name, state in entry["characters"].items():
+            history = self.characters[name]
+            history.insert(bisect.bisect_left([p for p, _ in history], page), [page, state])
+
+    def _unindex(self, page: int):
+        entry = self.pages.pop(page)
+        for term in entry["terms"]:
+            self.postings[term].pop(page, None)
+            if not self.postings[term]:
+                del self.postings[term]
+        for name in entry["characters"]:
+            self.characters[name] = [item for item in self.characters[name] if item[0] != page]
+            if not self.characters[name]:
+                del self.characters[name]
+
+    def _reorder(self):
+        self._order = sorted(self.pages)
+        self._prefix_lengths = [0]
+        for page in self._order:
+            self._prefix_lengths.append(self._prefix_lengths[-1] + self.pages[page]["length"])
+
+    def add_page(self, page: int, chapter: int, text: str, summary: str):
+        """Index ``page``'s summary and record the latest state of every character it names."""
+        summary = _strip_entities(summary)
+        counts = Counter(index_terms(summary))
+        sentences = split_sentences(text)
+        with self._lock:
+            replaced = page in self.pages
+            if replaced:
+                self._unindex(page)
+            characters = {}
+            for name in extract_entities(text, self.characters)[:MAX_ENTITIES]:
+                state = next((s for s in reversed(sentences) if name in s), "")
+                characters[name] = " ".join(state.split()[:STATE_WORDS])
+            entry = {"chapter": chapter, "summary": summary, "terms": dict(counts), "length": sum(counts.values()), "characters": characters}
+            self.pages[page] = entry
+            self._index(page, entry)
+            if not replaced and (not self._order or page > self._order[-1]):
+                # Pages are nearly always indexed in order, so the prefix sums just grow.
+                self._order.append(page)
+                self._prefix_lengths.append(self._prefix_lengths[-1] + entry["length"])
+            else:
+                self._reorder()
+            self._append(page, entry)
+
+    def _append(self, page: int, entry: dict):
+        if not self.path.exists():
+            self._compact()
+        else:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"page": page, **entry}, separators=(",", ":")) + "\n")
+        self.signature = _stat_signature(self.path)
+
+    def search(self, query: str, before_page: int, k: int = TOP_K, since_page: int = 1, extra_pages=()) -> list:
+        """Top ``k`` ``(page, score)`` matches for ``query`` among pages ``since_page`` to ``before_page - 1`` and ``extra_pages`` before them (BM25)."""
+        with self._lock:
+            lo = bisect.bisect_left(self._order, since_page)
+            hi = bisect.bisect_left(self._order, before_page)
+            extra = {page for page in extra_pages if page < min(since_page, before_page) and page in self.pages}
+            n = max(0, hi - lo) + len(extra)
+            if n <= 0:
+                return []
+            window_length = self._prefix_lengths[hi] - self._prefix_lengths[lo] if hi > lo else 0
+            average = (window_length + sum(self.pages[page]["length"] for page in extra)) / n or 1
+            matches = {}
+            for term in set(index_terms(query)):
+                postings = [(page, tf) for page, tf in self.postings.get(term, {}).items() if since_page <= page < before_page or page in extra]
+                if postings:
+                    matches[term] = postings
+            # Rarest terms carry the most signal; cap how many of them are scored.
+            terms = sorted(matches, key=lambda t: (len(matches[t]), t))[:MAX_QUERY_TERMS]
+            scores = defaultdict(float)
+            for term in terms:
+                postings = matches[term]
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for page, tf in postings:
+                    length = self.pages[page]["length"]
+                    scores[page] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average))
+            return heapq.nlargest(k, sorted(scores.items()), key=lambda item: item[1])
+
+    def passages(self, query: str, before_page: int, k: int = TOP_K, since_page: int = 1, extra_pages=()) -> str:
+        lines = []
+        for page, _ in sorted(self.search(query, before_page, k, since_page, extra_pages)):
+            words = self.pages[page]["summary"].split()
+            lines.append(f"Page {page}: " + " ".join(words[:PASSAGE_WORDS]) + (" ..." if len(words) > PASSAGE_WORDS else ""))
+        return "\n".join(lines)
+
+    def character_states(self, text: str, before_page: int, limit: int = MAX_CHARACTERS, since_page: int = 1, extra_pages=()) -> str:
+        """State of the characters named in ``text`` as of their last page in ``since_page`` to ``before_page - 1`` (or ``extra_pages``), most recent first."""
+        extra = set(extra_pages)
+        found = []
+        with self._lock:
+            for name in {name for _, name in find_names(text or "")}:
+                history = self.characters.get(name, [])
+                i = bisect.bisect_left([p for p, _ in history], before_page)
+                while i and history[i - 1][0] < since_page and history[i - 1][0] not in extra:
+                    i -= 1
+                if i and history[i - 1][1]:
+                    found.append((history[i - 1][0], name, history[i - 1][1]))
+        found.sort(key=lambda item: (-item[0], item[1]))
+        return "\n".join(f"{name} (page {page}): {state}" for page, name, state in found[:limit])
+
+def load_story_state(project_path: Path) -> StoryState:
+    """Return the project's story state, loading ``story_state.json`` once per process.
+
+    A long-running process (``serve``) reloads it if another process rewrote the file.
+    """
+    path = Path(project_path) / STATE_FILE
+    with _lock:
+        if path not in _memo or _memo[path].signature != _stat_signature(path):
+            _memo[path] = StoryState(path)
+        return _memo[path]